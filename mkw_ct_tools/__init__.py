@@ -18,6 +18,7 @@ if 'bpy' in locals():
     importlib.reload(export_settings)
     importlib.reload(node_manager)
     importlib.reload(model_settings)
+    importlib.reload(preferences)
     importlib.reload(track_info)
     importlib.reload(utils)
 
@@ -28,6 +29,7 @@ else:
     from . import export_settings
     from . import node_manager
     from . import model_settings
+    from . import preferences
     from . import track_info
     from . import utils
 
@@ -36,8 +38,11 @@ import bpy
 
 
 classes = (
+    preferences.ADDON_AP_mkwctt_preferences,
+
     export_settings.SCENE_PG_mkwctt_export_settings,
     export_settings.SCENE_OT_mkwctt_export,
+    export_settings.SCENE_OT_mkwctt_texture_cache_purge,
     export_settings.SCENE_PT_mkwctt_export_settings,
 
     track_info.SCENE_PG_mkwctt_race_settings,
@@ -94,6 +99,8 @@ def register():
     bpy.types.Texture.mkwctt_model_settings = bpy.props.PointerProperty(type=model_settings.TEXTURE_PG_mkwctt_model_settings)
 
 def unregister():
+    export.builder.shutdown()
+
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
 
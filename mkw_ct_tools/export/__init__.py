@@ -3,21 +3,43 @@ if 'bpy' in locals():
     import importlib
 
     importlib.reload(buffer)
+    importlib.reload(object_cache)  # before the modules registering persistent types
+    importlib.reload(builder)
     importlib.reload(collision)
     importlib.reload(error)
     importlib.reload(export_manager)
+    importlib.reload(geometry)
+    importlib.reload(mesh_data)
     importlib.reload(model)
+    importlib.reload(output_stream)
+    importlib.reload(profiler)
+    importlib.reload(quantize)
+    importlib.reload(steps)
     importlib.reload(string_table)
+    importlib.reload(texture_cache)
     importlib.reload(track_info)
+    importlib.reload(traversal)
+    importlib.reload(write_jobs)
 
 else:
     from . import buffer
+    from . import builder
     from . import collision
     from . import error
     from . import export_manager
+    from . import geometry
+    from . import mesh_data
     from . import model
+    from . import object_cache
+    from . import output_stream
+    from . import profiler
+    from . import quantize
+    from . import steps
     from . import string_table
+    from . import texture_cache
     from . import track_info
+    from . import traversal
+    from . import write_jobs
 
 
 from .error import ExportError
@@ -28,4 +50,5 @@ import bpy
 __all__ = [
     'ExportError',
     'export_manager',
+    'texture_cache',
 ]
@@ -1,7 +1,11 @@
 
+from contextlib import contextmanager
+import mmap
+import os
 from struct import Struct
 
 from mathutils import Vector
+import numpy as np
 
 
 V3F_ORDER = [0, -2, 1]
@@ -11,6 +15,35 @@ V3F_SCALE_ORDER = [0, 2, 1]
 """The order used by Mario Kart Wii for scale."""
 
 
+def order_components(data: np.ndarray, order: list) -> np.ndarray:
+    """
+    Reorder the components along the last axis of `data` the same way
+    `Buffer.putv` orders the components of a `Vector`, such that writing the
+    returned array with `Buffer.put_array_f32` produces the same bytes as
+    calling `putv` with `order` on each vector.
+    """
+    idcs = [abs(idx) for idx in order]
+    signs = [-1. if order[idx] < 0 else 1. for idx in idcs]
+    return data[..., idcs] * np.array(signs, dtype=data.dtype)
+
+
+def _as_array(data, dtype) -> np.ndarray:
+    if not isinstance(data, np.ndarray):
+        try:
+            data = memoryview(data)
+        except TypeError:
+            pass  # plain sequences such as lists are converted by numpy
+
+    src = np.asarray(data)
+    dst = np.dtype(dtype)
+    if dst.kind in 'iu' and src.dtype.kind in 'iub' and src.size > 0:
+        limits = np.iinfo(dst)
+        if src.min() < limits.min or src.max() > limits.max:
+            raise ValueError(f"array values out of range for {dst.name}; min={src.min()}, max={src.max()}")
+
+    return np.ascontiguousarray(src, dtype=dst).reshape(-1)
+
+
 class BufferOverflowError(RuntimeError):
     """
     A BufferOverflowError occurs when attempting to access or modify data
@@ -50,12 +83,13 @@ class Buffer:
     functions have multiple 'flavors', a suffix indicating the type and size of
     data to use. Some examples are `~8` which represents an 8-bit (1 byte)
     unsigned integer and `~f` which stands for a 32-bit (4 bytes) floating point
-    number. These functions also have as an optional argument an absolute index
-    into the buffer. Should that argument be provided, the function will operate
-    at said position, and the buffer state will remain unchanged. On the other
-    hand, if it is omitted, the function will operate at the buffer's current
-    position, and the position will be incremented by the size of the data,
-    effectively 'consuming' it.
+    number. The `put_array` functions write whole arrays of a given type in a
+    single operation. These functions also have as an optional argument an
+    absolute index into the buffer. Should that argument be provided, the
+    function will operate at said position, and the buffer state will remain
+    unchanged. On the other hand, if it is omitted, the function will operate at
+    the buffer's current position, and the position will be incremented by the
+    size of the data, effectively 'consuming' it.
 
     Lastly are the functions for constructing buffers. There is the constructor
     as well as the `copy` and `slice` functions. The constructor can create
@@ -109,6 +143,13 @@ class Buffer:
     the difference between the source's limit and the offset will be used. The
     length must be greater than or equal to zero, and the sum of the offset and
     the length must be less than or equal to the source's limit.
+
+    Instead of another buffer, the source can also be any object supporting the
+    buffer protocol, such as a `bytearray` or an `mmap.mmap`, in which case it
+    behaves like a buffer with a position of 0 and a limit of its length. This
+    lets a buffer write directly into the pages of a memory mapped file, see
+    `map_file`. A buffer over a read-only source, such as `bytes` or a read-only
+    map, can only be read from: writing to it raises a `TypeError`.
     """
 
     def __init__(self, *, src = None, copy = False, off: int = None, size: int = None):
@@ -122,6 +163,9 @@ class Buffer:
             self._data = memoryview(self._array)
 
         else:
+            if not isinstance(src, Buffer):
+                src = Buffer._over(src)
+
             if off is None:
                 off = src.pos
             elif abs(off) > src.limit:
@@ -137,9 +181,6 @@ class Buffer:
             if off + size > src.limit:
                 raise BufferOverflowError(f"off + size must be <= src limit; {off+size=}, {src.limit=}")
 
-            if copy:
-                self._array = bytearray(src._array)
-
             self._data = src._data[off:off+size]
             if copy:
                 self._array = bytearray(self._data)
@@ -153,14 +194,23 @@ class Buffer:
         self._su32 = Struct('>I')
         self._sf32 = Struct('>f')
 
+    @staticmethod
+    def _over(data):
+        buf = Buffer(size=0)
+        buf._array = data
+        buf._data = memoryview(data).cast('B')
+        buf._limit = len(buf._data)
+        return buf
+
     def __len__(self):
         return len(self._data)
 
     @property
-    def data(self) -> bytearray:
+    def data(self) -> memoryview:
         """
-        The backend data array, a `bytearray`. Note that this is not a copy, so
-        any modifications made to this array will be reflected in the buffer.
+        A `memoryview` of the backend data array, a `bytearray` or the source
+        object the buffer was built over. Note that this is not a copy, so any
+        modifications made to this array will be reflected in the buffer.
         """
         return self._data
 
@@ -345,11 +395,12 @@ class Buffer:
     def puta(self, data, pos: int = None):
         """
         Put an array of bytes in the buffer at the current position and
-        increment the position by the length of the array. The data can be of
-        any type as long as it is subscriptable by index, its length can be
-        queried, and the returned values are integers between 0 and 255. If
-        there are less bytes remaining in the buffer than the length of the
-        array, a `BufferOverflowError` is raised.
+        increment the position by the length of the array. Objects supporting
+        the buffer protocol (`bytes`, `bytearray`, `memoryview`, NumPy arrays,
+        etc.) are copied as raw bytes in a single operation. Any other data
+        must be iterable and yield integers between 0 and 255. If there are
+        less bytes remaining in the buffer than the length of the array, a
+        `BufferOverflowError` is raised.
 
         If the optional argument `pos` is provided, then that value is used as
         the position and the buffer's position is left unchanged. If `pos` is a
@@ -359,6 +410,11 @@ class Buffer:
         than the limit, or `pos` is less than 0 and its absolute value is
         greater than the length of the array, a `BufferOverflowError` is raised.
         """
+        try:
+            data = memoryview(data).cast('B')
+        except TypeError:
+            data = bytes(data)  # not a contiguous buffer, e.g. a list
+
         if pos is None:
             self._checkEnoughRemaining(len(data), True)
 
@@ -368,8 +424,7 @@ class Buffer:
         else:
             pos = self._calcAbsolutePosAndCheck(pos, len(data), True)
 
-        for i in range(len(data)):
-            self._data[pos+i] = data[i]
+        self._data[pos:pos+len(data)] = data
 
         return self
 
@@ -434,6 +489,126 @@ class Buffer:
 
         return self
 
+    def _put_array(self, dtype, data, pos):
+        data = _as_array(data, dtype)
+        size = data.nbytes
+
+        if pos is None:
+            self._checkEnoughRemaining(size, True)
+
+            pos = self._pos
+            self._pos += size
+
+        else:
+            pos = self._calcAbsolutePosAndCheck(pos, size, True)
+
+        self._data[pos:pos+size] = data.view(np.uint8)
+
+        return self
+
+    def put_array_u8(self, data, pos: int = None):
+        """
+        Put an array of bytes in the buffer at the current position and
+        increment the position by the length of the array. The data can be a
+        NumPy array, an `array.array`, any other object supporting the buffer
+        protocol, or a sequence of integers. All values must be between 0 and
+        255, otherwise a `ValueError` is raised. If there are less bytes
+        remaining in the buffer than the length of the array, a
+        `BufferOverflowError` is raised.
+
+        If the optional argument `pos` is provided, then that value is used as
+        the position and the buffer's position is left unchanged. If `pos` is a
+        negative value, it will be recalculated like slice notation, the limit
+        minus the absolute value of `pos`. If the absolute value of `pos` is
+        greater than the limit, `pos` plus the length of the array is greater
+        than the limit, or `pos` is less than 0 and its absolute value is
+        greater than the length of the array, a `BufferOverflowError` is raised.
+        """
+        return self._put_array('>u1', data, pos)
+
+    def put_array_u16(self, data, pos: int = None):
+        """
+        Put an array of shorts (2 bytes each) in the buffer at the current
+        position and increment the position by 2 times the length of the array.
+        The data can be a NumPy array, an `array.array`, any other object
+        supporting the buffer protocol, or a sequence of integers. Multi-
+        dimensional arrays are written in row-major order. All values must be
+        between 0 and 65535, otherwise a `ValueError` is raised. If there are
+        less bytes remaining in the buffer than the size of the data, a
+        `BufferOverflowError` is raised.
+
+        If the optional argument `pos` is provided, then that value is used as
+        the position and the buffer's position is left unchanged. If `pos` is a
+        negative value, it will be recalculated like slice notation, the limit
+        minus the absolute value of `pos`. If the absolute value of `pos` is
+        greater than the limit, `pos` plus the size of the data is greater than
+        the limit, or `pos` is less than 0 and its absolute value is greater
+        than the size of the data, a `BufferOverflowError` is raised.
+        """
+        return self._put_array('>u2', data, pos)
+
+    def put_array_s8(self, data, pos: int = None):
+        """
+        Put an array of signed bytes in the buffer at the current position and
+        increment the position by the length of the array. The data can be a
+        NumPy array, an `array.array`, any other object supporting the buffer
+        protocol, or a sequence of integers. Multi-dimensional arrays are
+        written in row-major order. All values must be between -128 and 127,
+        otherwise a `ValueError` is raised. If there are less bytes remaining
+        in the buffer than the length of the array, a `BufferOverflowError` is
+        raised.
+
+        If the optional argument `pos` is provided, then that value is used as
+        the position and the buffer's position is left unchanged. If `pos` is a
+        negative value, it will be recalculated like slice notation, the limit
+        minus the absolute value of `pos`. If the absolute value of `pos` is
+        greater than the limit, `pos` plus the length of the array is greater
+        than the limit, or `pos` is less than 0 and its absolute value is
+        greater than the length of the array, a `BufferOverflowError` is raised.
+        """
+        return self._put_array('>i1', data, pos)
+
+    def put_array_s16(self, data, pos: int = None):
+        """
+        Put an array of signed shorts (2 bytes each) in the buffer at the
+        current position and increment the position by 2 times the length of
+        the array. The data can be a NumPy array, an `array.array`, any other
+        object supporting the buffer protocol, or a sequence of integers.
+        Multi-dimensional arrays are written in row-major order. All values
+        must be between -32768 and 32767, otherwise a `ValueError` is raised.
+        If there are less bytes remaining in the buffer than the size of the
+        data, a `BufferOverflowError` is raised.
+
+        If the optional argument `pos` is provided, then that value is used as
+        the position and the buffer's position is left unchanged. If `pos` is a
+        negative value, it will be recalculated like slice notation, the limit
+        minus the absolute value of `pos`. If the absolute value of `pos` is
+        greater than the limit, `pos` plus the size of the data is greater than
+        the limit, or `pos` is less than 0 and its absolute value is greater
+        than the size of the data, a `BufferOverflowError` is raised.
+        """
+        return self._put_array('>i2', data, pos)
+
+    def put_array_f32(self, data, pos: int = None):
+        """
+        Put an array of floats (4 bytes each) in the buffer at the current
+        position and increment the position by 4 times the length of the array.
+        The data can be a NumPy array, an `array.array`, any other object
+        supporting the buffer protocol, or a sequence of numbers. Multi-
+        dimensional arrays are written in row-major order. If there are less
+        bytes remaining in the buffer than the size of the data, a
+        `BufferOverflowError` is raised.
+
+        If the optional argument `pos` is provided, then that value is used as
+        the position and the buffer's position is left unchanged. If `pos` is a
+        negative value, it will be recalculated like slice notation, the limit
+        minus the absolute value of `pos`. If the absolute value of `pos` is
+        greater than the limit, `pos` plus the size of the data is greater than
+        the limit, or `pos` is less than 0 and its absolute value is greater
+        than the size of the data, a `BufferOverflowError` is raised.
+        """
+        return self._put_array('>f4', data, pos)
+
     def _get(self, strct, size, pos):
         if pos is None:
             self._checkEnoughRemaining(size, False)
@@ -508,11 +683,13 @@ class Buffer:
         """
         return self._get(self._sf32, 4, pos)
 
-    def geta(self, size: int = None, pos: int = None) -> bytearray:
+    def view(self, size: int = None, pos: int = None) -> memoryview:
         """
-        Get get the next `size` bytes from the buffer at the current position
-        and increment the position by `size`. If there are less than `size`
-        bytes remaining in the buffer, a `BufferOverflowError` is raised.
+        Get a read-only `memoryview` of the next `size` bytes of the buffer at
+        the current position and increment the position by `size`. The data is
+        not copied, so any later modification to the buffer will be visible
+        through the returned view. If there are less than `size` bytes
+        remaining in the buffer, a `BufferOverflowError` is raised.
 
         If `size` is not provided, then the difference between the limit and the
         position is used.
@@ -539,7 +716,28 @@ class Buffer:
             if size is None:
                 size = self._limit - pos
 
-        return bytearray(self._data[pos:pos+size])
+        return self._data[pos:pos+size].toreadonly()
+
+    def geta(self, size: int = None, pos: int = None) -> bytearray:
+        """
+        Get get the next `size` bytes from the buffer at the current position
+        and increment the position by `size`. If there are less than `size`
+        bytes remaining in the buffer, a `BufferOverflowError` is raised. The
+        returned `bytearray` is a copy of the data; use `view` to access the
+        data without copying it.
+
+        If `size` is not provided, then the difference between the limit and the
+        position is used.
+
+        If the optional argument `pos` is provided, then that value is used as
+        the position and the buffer's position is left unchanged. If `pos` is a
+        negative value, it will be recalculated like slice notation, the limit
+        minus the absolute value of `pos`. If the absolute value of `pos` is
+        greater than the limit, `pos` plus `size` is greater than the limit, or
+        `pos` is less than 0 and its absolute value is greater than `size`, a
+        `BufferOverflowError` is raised.
+        """
+        return bytearray(self.view(size=size, pos=pos))
 
     def gets(self, size: int = None, nt = False, pos: int = None) -> str:
         """
@@ -603,11 +801,11 @@ class Buffer:
                 if tail != 0:
                     raise ValueError(f"string does not end with a null character; got {tail:#x}")
 
-        data = self.geta(size=size, pos=pos)
+        data = self.view(size=size, pos=pos)
         if nt:
             data = data[:-1]
 
-        return data.decode('ascii')
+        return str(data, 'ascii')
 
     def _checkEnoughRemaining(self, size, isinput):
         if self.remaining < size:
@@ -623,3 +821,37 @@ class Buffer:
             act = "write" if isinput else "read"
             raise BufferOverflowError(f"attempted to {act} past limit; pos ({pos}) + {size} > limit ({self._limit})")
         return pos
+
+
+@contextmanager
+def map_file(file, size: int = None):
+    """
+    Yield a `Buffer` over a shared memory map of the open `file`.
+
+    If `size` is given, the file is resized to `size` bytes and mapped for
+    writing: the data written to the buffer goes straight to the pages of the
+    file, and is written back by the operating system, without a copy of the
+    whole file in memory. The file must be open for reading and writing.
+
+    Otherwise, the whole file is mapped read-only, which is enough to read or
+    validate a file without loading it in memory.
+
+    The buffer and its slices must not be used after leaving the `with` block.
+    """
+    if size is not None:
+        file.truncate(size)
+    if (size if size is not None else os.fstat(file.fileno()).st_size) == 0:
+        yield Buffer(size=0)  # empty files cannot be mapped
+        return
+
+    access = mmap.ACCESS_READ if size is None else mmap.ACCESS_WRITE
+    mapping = mmap.mmap(file.fileno(), 0, access=access)
+    try:
+        yield Buffer(src=mapping)
+        if size is not None:
+            mapping.flush()
+    finally:
+        try:
+            mapping.close()
+        except BufferError:
+            pass  # slices are still referenced, the map is closed once they are freed
@@ -0,0 +1,183 @@
+
+from dataclasses import dataclass
+import os
+import queue
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+from . import steps
+from .error import ExportError
+
+
+@dataclass
+class BuildResult:
+    returncode: int = 0  # 0 on success
+    elapsed: float = 0.  # seconds
+    output: str = ""  # messages printed by the builder
+
+
+def check_path(path: str) -> str:
+    if not path:
+        raise ExportError("The SZS builder path is not set in the add-on preferences.")
+    if not os.path.isfile(path):
+        raise ExportError(f"The SZS builder '{path}' does not exist or is not a file.")
+    return path
+
+def szs_filepath(data_filepath: str) -> str:
+    """Return the path of the archive the builder makes from `data_filepath`, an `.szs.data` file."""
+    return os.path.splitext(data_filepath)[0]
+
+def run(path: str, data_filepath: str):
+    """
+    Run the builder at `path` once on `data_filepath`, and return a
+    `BuildResult`.
+    """
+    with tempfile.TemporaryFile() as output:
+        start = time.perf_counter()
+        process = subprocess.Popen([path, data_filepath], stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT)
+        returncode = yield from steps.wait_process(process, "Building SZS")
+        elapsed = time.perf_counter() - start
+
+        output.seek(0)
+        return BuildResult(returncode, elapsed, output.read().decode(errors='replace'))
+
+def run_piped(path: str, output_filepath: str, write_steps):
+    """
+    Run the builder at `path` once, building to `output_filepath` the data
+    written to its standard input by `write_steps(file)`, a generator function
+    of export steps, and return a `BuildResult`. No intermediate file is
+    written.
+    """
+    with tempfile.TemporaryFile() as output:
+        start = time.perf_counter()
+        process = subprocess.Popen([path, '-', output_filepath], stdin=subprocess.PIPE, stdout=output, stderr=subprocess.STDOUT)
+        try:
+            yield from write_steps(process.stdin)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # the builder exited early, its status and output tell why
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+
+        returncode = yield from steps.wait_process(process, "Building SZS")
+        elapsed = time.perf_counter() - start
+
+        output.seek(0)
+        return BuildResult(returncode, elapsed, output.read().decode(errors='replace'))
+
+
+class BuilderService:
+    """
+    Keep the builder at `path` running in server mode, and send it the data to
+    build through its standard input. Each request is the length of the output
+    path, the output path (UTF-8), the length of the data and the data, and
+    each response is a status, 0 on success, followed by the length of a
+    message and the message. All integers are 32-bit big endian.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self._process = subprocess.Popen([path, '--server'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._responses = queue.Queue()
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+
+    def _read_responses(self):
+        stdout = self._process.stdout
+        while True:
+            header = stdout.read(0x08)
+            if len(header) < 0x08:
+                self._responses.put(None)  # the process exited
+                return
+
+            status, size = struct.unpack('>II', header)
+            self._responses.put((status, stdout.read(size).decode(errors='replace')))
+
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def build(self, data, output_filepath: str):
+        """
+        Build `data`, the content of an `.szs.data` file supporting the buffer
+        protocol, to `output_filepath`, and return a `BuildResult`.
+        """
+        data = memoryview(data).cast('B')
+
+        def write_steps(file):
+            yield from steps.run_in_thread("Sending the track data to the builder", file.write, data)
+
+        return (yield from self.build_piped(output_filepath, data.nbytes, write_steps))
+
+    def build_piped(self, output_filepath: str, size: int, write_steps):
+        """
+        Build to `output_filepath` the `size` bytes written to the input of the
+        service by `write_steps(file)`, a generator function of export steps,
+        and return a `BuildResult`. If the steps are closed before the build is
+        done, the service is closed.
+        """
+        path = output_filepath.encode('utf-8')
+
+        start = time.perf_counter()
+        try:
+            stdin = self._process.stdin
+            stdin.write(struct.pack('>I', len(path)) + path + struct.pack('>I', size))
+            yield from write_steps(stdin)
+            stdin.flush()
+
+            while True:
+                try:
+                    response = self._responses.get(timeout=steps.POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    yield steps.Waiting("Building SZS")
+        except OSError:
+            self.close()
+            raise ExportError("The SZS builder service exited unexpectedly.")
+        except BaseException:
+            self.close()  # the service is left in the middle of a request
+            raise
+
+        if response is None:
+            self.close()
+            raise ExportError(f"The SZS builder service exited unexpectedly with status {self._process.returncode}.")
+
+        status, message = response
+        return BuildResult(status, time.perf_counter() - start, message)
+
+    def close(self):
+        if self._process.poll() is None:
+            try:
+                self._process.stdin.close()  # the server exits at the end of its input
+            except OSError:
+                pass
+            try:
+                self._process.wait(timeout=1.)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+
+
+_service = None
+
+def get_service(path: str) -> BuilderService:
+    """Return the running service of the builder at `path`, starting it if needed."""
+    global _service
+    if _service is not None and (_service.path != path or not _service.alive()):
+        _service.close()
+        _service = None
+
+    if _service is None:
+        _service = BuilderService(path)
+    return _service
+
+def shutdown():
+    global _service
+    if _service is not None:
+        _service.close()
+        _service = None
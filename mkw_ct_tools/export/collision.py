@@ -2,9 +2,14 @@
 from dataclasses import dataclass, field
 
 import bpy
+import numpy as np
 
 from .. import utils
-from .buffer import Buffer, V3F_ORDER
+from . import mesh_data
+from . import object_cache
+from . import profiler
+from .buffer import Buffer, V3F_ORDER, order_components
+from .write_jobs import WriteJobs
 
 
 @dataclass
@@ -12,8 +17,17 @@ class CollisionOutputInfo:
     size: int = 0
 
     face_count: int = 0
-    verts: list = field(default_factory=list)
-    flags: list = field(default_factory=list)
+    verts: list = field(default_factory=list)  # one (face_count * 3, 3) array per object
+    flags: list = field(default_factory=list)  # one (face_count,) array per object
+
+    geometries: dict = field(default_factory=dict)  # object_cache.instance_key -> CollisionGeometry, shared by instances
+
+
+@object_cache.register_persistent_type
+@dataclass
+class CollisionGeometry:
+    corners: np.ndarray = None  # (tri_count, 3, 3) object space triangle corners
+    tri_mats: np.ndarray = None
 
 
 def calc_kcl_flag(obj: bpy.types.Object, mat_idx):
@@ -34,51 +48,74 @@ def calc_kcl_flag(obj: bpy.types.Object, mat_idx):
 
     return (kclsw << 15) | (kclnd << 14) | (kcltr << 13) | (kclv << 5) | kclt
 
-def collect_objects(collection: bpy.types.Collection, scale, info: CollisionOutputInfo):
-    collection_settings = collection.mkwctt_collection_settings
-    if not collection_settings.has_collision:
+def calc_kcl_flag_table(obj: bpy.types.Object) -> np.ndarray:  # -1 for the slots without collision
+    slot_count = max(len(obj.material_slots), 1)
+
+    table = np.empty(slot_count, dtype=np.int32)
+    for mat_idx in range(slot_count):
+        kcl_flag = calc_kcl_flag(obj, mat_idx)
+        table[mat_idx] = -1 if kcl_flag is None else kcl_flag
+
+    return table
+
+def read_geometry(arrays: mesh_data.MeshArrays) -> CollisionGeometry:
+    return CollisionGeometry(corners=arrays.positions[arrays.tri_verts], tri_mats=arrays.tri_mats)
+
+def collect_object(obj: bpy.types.Object, scale, info: CollisionOutputInfo, meshes: mesh_data.MeshArraysStore, cache: object_cache.ObjectCache = None):
+    collision_settings = obj.mkwctt_collision_settings
+    if not collision_settings.enable:
         return
 
-    for obj in collection.objects:
-        if obj.type != 'MESH':
-            continue
+    instance_key = object_cache.instance_key(obj)
+    geometry = info.geometries.get(instance_key)
 
-        collision_settings = obj.mkwctt_collision_settings
-        if not collision_settings.enable:
-            continue
+    if geometry is None and cache is not None:
+        key = object_cache.arrays_key(meshes[obj], 'collision')
+        geometry = cache.get(key)
+        if geometry is not None:
+            profiler.count(cache_hits=1)
 
-        mesh = obj.to_mesh()
-        mesh.transform(obj.matrix_world)
-        mesh.calc_loop_triangles()
-        for tri in mesh.loop_triangles:
-            kcl_flag = calc_kcl_flag(obj, tri.material_index)
-            if kcl_flag is None:
-                continue
+    if geometry is None:
+        geometry = read_geometry(meshes[obj])
+        if cache is not None:
+            cache.put(key, geometry)
 
-            for vert in tri.vertices:
-                info.verts.append(mesh.vertices[vert].co * scale)
+    info.geometries[instance_key] = geometry
 
-            info.flags.append(kcl_flag)
+    tri_mats = geometry.tri_mats
 
-            info.face_count += 1
+    flag_table = calc_kcl_flag_table(obj)
+    tri_flags = flag_table[np.minimum(tri_mats, len(flag_table) - 1)]
+    tri_mask = tri_flags >= 0
+    if not tri_mask.any():
+        return
 
-    for coll in collection.children:
-        collect_objects(coll, scale, info)
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    positions = geometry.corners[tri_mask].reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    positions *= scale
 
-def get_output_info(context):
-    info = CollisionOutputInfo()
+    face_count = int(tri_mask.sum())
+    info.verts.append(positions.astype(np.float32))
+    info.flags.append(tri_flags[tri_mask].astype(np.uint16))
+    info.face_count += face_count
+    profiler.count(kcl_triangles=face_count)
 
-    collect_objects(context.scene.collection, context.scene.mkwctt_export_settings.scale, info)
+def calc_layout(info: CollisionOutputInfo):
     info.size = 0x04 + info.face_count * 0x26
 
-    return info
 
+def write_verts(verts: np.ndarray, out: Buffer, pos: int):
+    out.put_array_f32(order_components(verts, V3F_ORDER), pos)
+
+def export_collision(context, info: CollisionOutputInfo, out: Buffer, jobs: WriteJobs = None):
+    jobs = WriteJobs() if jobs is None else jobs
 
-def export_collision(context, info: CollisionOutputInfo, out: Buffer):
     out.put32(info.face_count)
 
-    for vert in info.verts:
-        out.putv(vert, order=V3F_ORDER)
+    for verts in info.verts:
+        jobs.submit(write_verts, verts, out, out.pos)
+        out.pos += verts.nbytes
 
-    for flag in info.flags:
-        out.put16(flag)
+    for flags in info.flags:
+        jobs.submit(out.put_array_u16, flags, out.pos)
+        out.pos += flags.nbytes
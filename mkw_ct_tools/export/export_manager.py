@@ -1,16 +1,28 @@
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 import os
 
 import bpy
 
+from . import builder
 from . import collision
+from . import geometry
+from . import mesh_data
 from . import model
+from . import object_cache
+from . import output_stream
+from . import profiler
+from . import steps
 from . import track_info
+from . import traversal
+from .. import preferences
 from .. import utils
-from .buffer import Buffer
+from .buffer import Buffer, map_file
 from .error import ExportError
+from .output_stream import OutputStream
 from .string_table import StringTable
+from .write_jobs import WriteJobs
 
 
 FILE_NAME_BY_ID = [
@@ -65,21 +77,74 @@ class OutputInfo:
     string_table_off: int = 0
     string_table: StringTable = field(default_factory=StringTable)
 
+    messages: list = field(default_factory=list)  # (report type, message) to show the user, e.g. ('WARNING', "...")
+
+
+@dataclass
+class ExportResult:
+    prof: profiler.Profiler = None  # `None` unless profiling is enabled
+    messages: list = field(default_factory=list)  # see `OutputInfo.messages`
+
 
 def get_output_info(context):
+    return steps.run(get_output_info_steps(context))
+
+def get_output_info_steps(context):
     output_info = OutputInfo()
     output_info.total_size = 0x10
 
+    with profiler.phase("track info"):
+        output_info.track_output_info = track_info.get_output_info(context)
+    yield "Collecting track info"
+
+    with profiler.phase("models"):
+        output_info.models_output_info = model.get_output_info(context, output_info.string_table)
+    yield "Collecting materials"
+
+    output_info.collision_output_info = collision.CollisionOutputInfo()
+
+    cache = object_cache.begin_export(context)
+    meshes = mesh_data.MeshArraysStore(context.evaluated_depsgraph_get())
+
+    export_settings = context.scene.mkwctt_export_settings
+    if export_settings.use_multiprocessing:
+        pool = geometry.process_pool(export_settings.worker_count if export_settings.worker_count > 0 else None)
+    else:
+        pool = ThreadPoolExecutor(max_workers=1)  # keeps building geometry off the thread running the UI
+
+    try:
+        with profiler.phase("objects"):
+            traversal_result = yield from traversal.collect_objects(
+                context.view_layer.layer_collection,
+                output_info.models_output_info,
+                output_info.collision_output_info,
+                output_info.string_table,
+                export_settings.scale,
+                meshes,
+                cache,
+                pool,
+            )
+
+        with profiler.phase("finish objects"):
+            yield from model.finish_objects(output_info.models_output_info, cache)
+    finally:
+        pool.shutdown(wait=export_settings.use_multiprocessing, cancel_futures=True)  # a cancelled build in a thread finishes on its own
+
+    object_cache.end_export(context, cache)
+    output_info.messages += report_duplicates(traversal_result)
+    output_info.messages.append(report_memory(meshes))
+
+    with profiler.phase("layout"):
+        model.calc_layout(output_info.models_output_info, output_info.string_table)
+        collision.calc_layout(output_info.collision_output_info)
+
     output_info.track_output_off = output_info.total_size
-    output_info.track_output_info = track_info.get_output_info(context)
     output_info.total_size += output_info.track_output_info.size
 
     output_info.models_output_off = output_info.total_size
-    output_info.models_output_info = model.get_output_info(context, output_info.string_table)
     output_info.total_size += output_info.models_output_info.size
 
     output_info.collision_output_off = output_info.total_size
-    output_info.collision_output_info = collision.get_output_info(context)
     output_info.total_size += output_info.collision_output_info.size
 
     output_info.string_table_off = output_info.total_size
@@ -87,42 +152,165 @@ def get_output_info(context):
 
     return output_info
 
+def report_duplicates(result: traversal.TraversalResult) -> list:
+    messages = []
+    skipped_count = len(result.duplicate_collections) + len(result.duplicate_objects)
+    if skipped_count == 0:
+        return messages
+    profiler.count(duplicates_skipped=skipped_count)
+
+    if len(result.duplicate_collections) > 0:
+        messages.append(('WARNING', f"Skipped {len(result.duplicate_collections)} collections already exported through another parent: {', '.join(result.duplicate_collections)}"))
+    if len(result.duplicate_objects) > 0:
+        messages.append(('WARNING', f"Skipped {len(result.duplicate_objects)} objects already exported through another collection: {', '.join(result.duplicate_objects)}"))
+    return messages
+
+def report_memory(meshes: mesh_data.MeshArraysStore) -> tuple:
+    peak = profiler.peak_process_memory()
+    profiler.count(mesh_arrays_peak_bytes=meshes.peak_nbytes)
+
+    message = f"Evaluated {meshes.evaluated_count} meshes, holding at most {meshes.peak_nbytes / (1024 * 1024):.1f} MB of mesh arrays at once"
+    if peak is not None:
+        profiler.count(peak_process_bytes=peak)
+        message += f", peak memory: {peak / (1024 * 1024):.1f} MB"
+    return ('INFO', message)
+
 def export_string_table(string_table: StringTable, out: Buffer):
     for string in string_table.strings.keys():
         out.puts(string, nt=True)
 
-def write(context, outdir, out: Buffer):
+def output_filepath(context, outdir) -> str:
     track_slot_id = utils.get_enum_number(context.scene.mkwctt_race_settings, 'track_slot')
-    filepath = outdir + FILE_NAME_BY_ID[track_slot_id] + '.szs.data'
-    with open(filepath, 'wb') as file:
-        file.write(out.data)
+    return outdir + FILE_NAME_BY_ID[track_slot_id] + '.szs.data'
 
-    import subprocess
-    subprocess.run(["H:/Coding/VSCode/MKW/CTToolsBlender/build/Source/Debug/SZSBuilder.exe", filepath])
+def run_builder(context, filepath):
+    prefs = preferences.get_preferences(context)
+    path = builder.check_path(bpy.path.abspath(prefs.builder_path))
 
-def export(context, outdir):
-    if not os.path.isdir(outdir):
-        raise ExportError(f"The path '{outdir}' does not exist or is not a directory.")
+    with profiler.phase("builder"):
+        if prefs.use_builder_service:
+            with open(filepath, 'rb') as file, map_file(file) as data:
+                result = yield from builder.get_service(path).build(data.data, builder.szs_filepath(filepath))
+        else:
+            result = yield from builder.run(path, filepath)
+
+    check_build_result(result, builder.szs_filepath(filepath))
 
-    output_info = get_output_info(context)
+def pipe_to_builder(context, output_info: OutputInfo, szs_filepath):
+    prefs = preferences.get_preferences(context)
+    path = builder.check_path(bpy.path.abspath(prefs.builder_path))
 
-    out = Buffer(size=output_info.total_size)
+    def write_steps(file):
+        with profiler.phase("write"):
+            yield from write_output_steps(context, output_info, file)
 
-    out.put32(output_info.track_output_off)
-    out.put32(output_info.models_output_off)
-    out.put32(output_info.collision_output_off)
-    out.put32(output_info.string_table_off)
+    with profiler.phase("builder"):
+        if prefs.use_builder_service:
+            result = yield from builder.get_service(path).build_piped(szs_filepath, output_info.total_size, write_steps)
+        else:
+            result = yield from builder.run_piped(path, szs_filepath, write_steps)
 
-    out.pos = output_info.track_output_off
-    track_info.export_track_info(context, out.slice(size=output_info.track_output_info.size))
+    check_build_result(result, szs_filepath)
 
-    out.pos = output_info.models_output_off
-    model.export_models(context, output_info.models_output_info, out.slice(size=output_info.models_output_info.size))
+def check_build_result(result: builder.BuildResult, szs_filepath):
+    if result.returncode != 0:
+        raise ExportError(f"The SZS builder failed with status {result.returncode}: {result.output.strip()}")
+    print(f"Built '{szs_filepath}' in {result.elapsed:.2f} s")
+
+def write_output(context, output_info: OutputInfo, file = None) -> Buffer:
+    return steps.run(write_output_steps(context, output_info, file))
+
+def write_output_steps(context, output_info: OutputInfo, file = None):
+    export_settings = context.scene.mkwctt_export_settings
+
+    pool = ThreadPoolExecutor(None if export_settings.use_parallel_write else 1)
+
+    try:
+        jobs = WriteJobs(pool)
+
+        if file is None:
+            out = Buffer(size=output_info.total_size)
+            yield from write_sections(context, output_info, out, jobs)
+            return out
+
+        if export_settings.use_streaming_write:
+            out = OutputStream(file, output_info.total_size, jobs)
+            yield from write_sections(context, output_info, out, jobs)
+            with profiler.phase("flush"):
+                out.close()
+                profiler.count(bytes=out.written)
+        elif file.seekable():
+            with map_file(file, output_info.total_size) as out:
+                yield from write_sections(context, output_info, out, jobs)
+            profiler.count(bytes=output_info.total_size)
+        else:  # a pipe, such as the input of the builder
+            out = Buffer(size=output_info.total_size)
+            yield from write_sections(context, output_info, out, jobs)
+            with profiler.phase("flush"):
+                yield from steps.run_in_thread("Sending the track data to the builder", file.write, out.data)
+                profiler.count(bytes=output_info.total_size)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    return None
+
+def write_sections(context, output_info: OutputInfo, out, jobs: WriteJobs):
+    header = output_stream.section(out, 0x00, 0x10)
+    header.put32(output_info.track_output_off)
+    header.put32(output_info.models_output_off)
+    header.put32(output_info.collision_output_off)
+    header.put32(output_info.string_table_off)
+
+    with profiler.phase("track info"):
+        track_info.export_track_info(context, output_stream.section(out, output_info.track_output_off, output_info.track_output_info.size))
+        profiler.count(bytes=output_info.track_output_info.size)
+    yield "Writing track info"
+
+    with profiler.phase("models"):
+        yield from model.export_models(context, output_info.models_output_info, out.slice(off=output_info.models_output_off, size=output_info.models_output_info.size), jobs)
+        profiler.count(bytes=output_info.models_output_info.size)
+
+    with profiler.phase("collision"):
+        collision.export_collision(context, output_info.collision_output_info, output_stream.section(out, output_info.collision_output_off, output_info.collision_output_info.size), jobs)
+        profiler.count(bytes=output_info.collision_output_info.size)
+
+    with profiler.phase("string table"):
+        export_string_table(output_info.string_table, output_stream.section(out, output_info.string_table_off, output_info.string_table.total_len))
+        profiler.count(bytes=output_info.string_table.total_len)
+
+    with profiler.phase("wait jobs"):
+        yield from steps.wait_jobs(jobs, "Waiting for the write jobs")
+
+def write_all(context, outdir):
+    with profiler.phase("collect"):
+        output_info = yield from get_output_info_steps(context)
+
+    filepath = output_filepath(context, outdir)
+    if not context.scene.mkwctt_export_settings.keep_intermediate_file:
+        yield from pipe_to_builder(context, output_info, builder.szs_filepath(filepath))
+        return output_info.messages
+
+    with profiler.phase("write"):
+        with open(filepath, 'w+b') as file:
+            yield from write_output_steps(context, output_info, file)
+
+    yield from run_builder(context, filepath)
+    return output_info.messages
+
+def export(context, outdir):
+    return steps.run(export_steps(context, outdir))
+
+def export_steps(context, outdir):  # closing the steps cancels the export
+    if not os.path.isdir(outdir):
+        raise ExportError(f"The path '{outdir}' does not exist or is not a directory.")
 
-    out.pos = output_info.collision_output_off
-    collision.export_collision(context, output_info.collision_output_info, out.slice(size=output_info.collision_output_info.size))
+    export_settings = context.scene.mkwctt_export_settings
+    with profiler.session(enable=export_settings.enable_profiling) as prof:
+        with profiler.phase("export"):
+            messages = yield from steps.exclude_suspended(write_all(context, outdir))
 
-    out.pos = output_info.string_table_off
-    export_string_table(output_info.string_table, out.slice(size=output_info.string_table.total_len))
+        if prof is not None and export_settings.profile_filepath:
+            from .. import bl_info
+            prof.save_json(bpy.path.abspath(export_settings.profile_filepath), version=bl_info['version'], blender_version=bpy.app.version)
 
-    write(context, outdir, out)
+    return ExportResult(prof, messages)
@@ -0,0 +1,220 @@
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import multiprocessing
+import os
+import runpy
+import sys
+import types
+
+import numpy as np
+
+
+# This module must not import bpy (directly or through another module of the
+# add-on) since its functions run in worker processes, see `process_pool`.
+
+
+MAX_DRAW_COUNT = 0xFFFF  # the vertex count of a draw command is 16-bit
+
+
+@dataclass
+class MeshArrays:
+    positions: np.ndarray = None
+    normals: np.ndarray = None
+
+    colors: list = field(default_factory=list)
+    texcoords: list = field(default_factory=list)
+
+    tri_verts: np.ndarray = None
+    tri_loops: np.ndarray = None
+    tri_mats: np.ndarray = None
+
+
+@dataclass
+class ModelGeometry:
+    verts: np.ndarray = None
+    norms: np.ndarray = None
+
+    colors: list = field(default_factory=list)
+    texcoords: list = field(default_factory=list)
+
+    part_inds: dict = field(default_factory=dict)  # material index -> one row of attribute indices per vertex, strips first, then a triangle list
+    part_strips: dict = field(default_factory=dict)  # material index -> vertex count of each strip at the start of the part indices
+
+
+def unique_rows(data: np.ndarray):
+    """
+    Deduplicate the rows of `data` and return a tuple of the unique rows, in the
+    order they are first seen, and the index into the unique rows of every row
+    of `data`.
+    """
+    if len(data) == 0:
+        return data, np.zeros(0, dtype=np.intp)
+
+    uniq, first, inverse = np.unique(data, axis=0, return_index=True, return_inverse=True)
+
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+
+    return uniq[order], remap[inverse.reshape(-1)]
+
+def build_geometry(arrays: MeshArrays, mat_indices: list) -> ModelGeometry:
+    """
+    Deduplicate the attributes of the triangles of `arrays` using one of the
+    materials in `mat_indices`, and build the attribute indices of each of
+    these materials.
+    """
+    geometry = ModelGeometry()
+
+    tri_mask = np.isin(arrays.tri_mats, mat_indices)
+    corner_verts = arrays.tri_verts[tri_mask, ::-1].reshape(-1)  # blender draws ccw while wii draws cw
+    corner_loops = arrays.tri_loops[tri_mask, ::-1].reshape(-1)
+    corner_mats = np.repeat(arrays.tri_mats[tri_mask], 3)
+
+    geometry.verts, vert_inds = unique_rows(arrays.positions[corner_verts])
+    geometry.norms, norm_inds = unique_rows(arrays.normals[corner_verts])
+    inds = [vert_inds, norm_inds]
+
+    for colors in arrays.colors:
+        colors, color_inds = unique_rows(colors[corner_loops])
+        geometry.colors.append(colors)
+        inds.append(color_inds)
+
+    for texcoords in arrays.texcoords:
+        texcoords, texcoord_inds = unique_rows(texcoords[corner_loops])
+        geometry.texcoords.append(texcoords)
+        inds.append(texcoord_inds)
+
+    inds = np.stack(inds, axis=1)
+
+    for mat_idx in mat_indices:
+        geometry.part_inds[mat_idx], geometry.part_strips[mat_idx] = build_strips(inds[corner_mats == mat_idx])
+
+    return geometry
+
+def stripify(tris: np.ndarray):
+    """
+    Greedily join the triangles `tris`, rows of 3 vertex ids in drawing order,
+    into strips, each drawing its triangles with the same winding as `tris`.
+    Return the vertex ids of the strips concatenated, the vertex count of each
+    strip, and the indices of the triangles left out of the strips, which must
+    be drawn as a list.
+
+    Strips are started from the triangles in order and extended through the
+    first unused triangle sharing their last edge, so the result only depends
+    on `tris` and takes linear time. Where more than two triangles share an
+    edge, only the first one can extend a strip through it.
+    """
+    empty = np.zeros(0, dtype=np.intp)
+    if len(tris) == 0:
+        return empty, empty, empty
+
+    tris = tris.astype(np.int64)
+    vert_count = int(tris.max()) + 1  # edges and triangle vertices are packed into single integers
+    a, b, c = tris[:, 0], tris[:, 1], tris[:, 2]
+    tri_ids = np.arange(len(tris), dtype=np.int64)
+    degenerate = (a == b) | (b == c) | (c == a)
+
+    # directed edge (p, q) -> first triangle having it and its third vertex r, as p * V + q -> tri_idx * V + r
+    valid = np.tile(~degenerate, 3)
+    keys = np.concatenate([a * vert_count + b, b * vert_count + c, c * vert_count + a])[valid]
+    values = np.concatenate([tri_ids * vert_count + c, tri_ids * vert_count + a, tri_ids * vert_count + b])[valid]
+    edges = dict(zip(keys[::-1].tolist(), values[::-1].tolist()))  # reversed so the first triangle is kept
+
+    used = bytearray(len(tris))
+    strip_verts = []
+    strip_lengths = []
+    list_tris = []
+    for tri_idx, (x, y, z), is_degenerate in zip(range(len(tris)), tris.tolist(), degenerate.tolist()):
+        if used[tri_idx]:
+            continue
+        used[tri_idx] = 1
+
+        if is_degenerate:
+            list_tris.append(tri_idx)  # only drawn as is
+            continue
+
+        # the second triangle of a strip (x, y, z) is drawn reversed, so it shares the edge (z, y)
+        for _ in range(3):
+            value = edges.get(z * vert_count + y)
+            if value is not None and not used[value // vert_count]:
+                break
+            x, y, z = y, z, x
+        else:
+            list_tris.append(tri_idx)
+            continue
+
+        strip = [x, y, z]
+        while len(strip) < MAX_DRAW_COUNT:
+            p, q = strip[-2], strip[-1]
+            value = edges.get(p * vert_count + q if len(strip) % 2 == 0 else q * vert_count + p)  # odd triangles are drawn reversed
+            if value is None:
+                break
+            next_tri_idx, r = divmod(value, vert_count)
+            if used[next_tri_idx]:
+                break
+            used[next_tri_idx] = 1
+            strip.append(r)
+
+        strip_verts += strip
+        strip_lengths.append(len(strip))
+
+    return np.array(strip_verts, dtype=np.intp), np.array(strip_lengths, dtype=np.intp), np.array(list_tris, dtype=np.intp)
+
+def build_strips(inds: np.ndarray):
+    """
+    Reorder `inds`, one row of attribute indices per triangle corner, into
+    strips followed by a triangle list, see `stripify`. Corners are only
+    shared by strips if all their attribute indices are the same. Return the
+    reordered rows and the vertex count of each strip.
+    """
+    if len(inds) == 0:
+        return inds, np.zeros(0, dtype=np.intp)
+
+    verts, vert_ids = unique_rows(inds)
+    strip_verts, strip_lengths, list_tris = stripify(vert_ids.reshape(-1, 3))
+
+    list_inds = inds.reshape(-1, 3, inds.shape[1])[list_tris].reshape(-1, inds.shape[1])
+    return np.concatenate([verts[strip_verts], list_inds]), strip_lengths
+
+def triangle_count(inds: np.ndarray, strip_lengths: np.ndarray) -> int:
+    """Return the number of triangles drawn by `inds` and `strip_lengths`, see `build_strips`."""
+    strip_vert_count = int(strip_lengths.sum())
+    return strip_vert_count - 2 * len(strip_lengths) + (len(inds) - strip_vert_count) // 3
+
+
+WORKER_RUN_NAME = '__mkwctt_geometry_worker__'
+
+def _register_packages(package: str):
+    """
+    Register the packages enclosing this module in `sys.modules` as plain
+    namespaces, so this module can be imported in a worker process without
+    running the `__init__` of the add-on, which imports bpy.
+    """
+    path = os.path.dirname(os.path.abspath(__file__))
+    names = package.split('.')
+    for idx in range(len(names), 0, -1):
+        name = '.'.join(names[:idx])
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__path__ = [path]
+            sys.modules[name] = module
+        path = os.path.dirname(path)
+
+def process_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    Return a pool of worker processes to run `build_geometry` with. Blender
+    cannot be forked safely, so the workers are spawned, and each one only
+    imports this module and NumPy, by running this file with `runpy` first.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=runpy.run_path,
+        initargs=(os.path.abspath(__file__), {'WORKER_PACKAGE': __package__}, WORKER_RUN_NAME),
+    )
+
+
+if __name__ == WORKER_RUN_NAME:
+    _register_packages(WORKER_PACKAGE)
@@ -0,0 +1,108 @@
+
+from contextlib import contextmanager
+
+import bpy
+import numpy as np
+
+from .geometry import MeshArrays
+
+
+def read_mesh_arrays(mesh: bpy.types.Mesh):
+    """
+    Copy the vertex, loop and triangle data used by the model and the collision
+    out of `mesh` into NumPy arrays using `foreach_get`.
+    """
+    arrays = MeshArrays()
+
+    vert_count = len(mesh.vertices)
+    arrays.positions = np.empty(vert_count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', arrays.positions)
+    arrays.positions.shape = (vert_count, 3)
+
+    arrays.normals = np.empty(vert_count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('normal', arrays.normals)
+    arrays.normals.shape = (vert_count, 3)
+
+    loop_count = len(mesh.loops)
+    for color_layer in mesh.vertex_colors[:2]:  # mdl0 support up to 2 vertex color layers per object
+        colors = np.empty(loop_count * 4, dtype=np.float32)
+        color_layer.data.foreach_get('color', colors)
+        arrays.colors.append(colors.reshape(loop_count, 4))
+
+    for uv_layer in mesh.uv_layers[:8]:  # mdl0 support up to 8 texture coord layers per object
+        texcoords = np.empty(loop_count * 2, dtype=np.float32)
+        uv_layer.data.foreach_get('uv', texcoords)
+        arrays.texcoords.append(texcoords.reshape(loop_count, 2))
+
+    mesh.calc_loop_triangles()
+    tri_count = len(mesh.loop_triangles)
+
+    arrays.tri_verts = np.empty(tri_count * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', arrays.tri_verts)
+    arrays.tri_verts.shape = (tri_count, 3)
+
+    arrays.tri_loops = np.empty(tri_count * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('loops', arrays.tri_loops)
+    arrays.tri_loops.shape = (tri_count, 3)
+
+    arrays.tri_mats = np.empty(tri_count, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('material_index', arrays.tri_mats)
+
+    return arrays
+
+@contextmanager
+def evaluated_mesh(obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph):
+    """
+    Yield the mesh of `obj` with its modifiers and shape keys applied, as
+    evaluated in `depsgraph`. The mesh is a temporary copy which is freed when
+    leaving the `with` block, so no reference to it or its data must be kept.
+    """
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    try:
+        yield mesh
+    finally:
+        obj_eval.to_mesh_clear()
+
+
+class MeshArraysStore:
+    """
+    Hold the arrays read from the evaluated mesh of each object during an
+    export, so the model and the collision share a single evaluation of each
+    object. The arrays of an object are only read when first requested, and
+    should be released once every builder is done with the object.
+    """
+
+    def __init__(self, depsgraph: bpy.types.Depsgraph):
+        self._depsgraph = depsgraph
+        self._arrays = dict()
+
+        self.evaluated_count = 0
+        self.nbytes = 0
+        self.peak_nbytes = 0
+
+    def __getitem__(self, obj: bpy.types.Object) -> MeshArrays:
+        arrays = self._arrays.get(obj.name_full)
+        if arrays is None:
+            with evaluated_mesh(obj, self._depsgraph) as mesh:
+                arrays = read_mesh_arrays(mesh)
+            self._arrays[obj.name_full] = arrays
+
+            self.evaluated_count += 1
+            self.nbytes += arrays_nbytes(arrays)
+            self.peak_nbytes = max(self.peak_nbytes, self.nbytes)
+        return arrays
+
+    def release(self, obj: bpy.types.Object):
+        arrays = self._arrays.pop(obj.name_full, None)
+        if arrays is not None:
+            self.nbytes -= arrays_nbytes(arrays)
+
+
+def arrays_nbytes(arrays: MeshArrays) -> int:
+    total = 0
+    for data in (arrays.positions, arrays.normals, arrays.tri_verts, arrays.tri_loops, arrays.tri_mats):
+        total += data.nbytes
+    for data in arrays.colors + arrays.texcoords:
+        total += data.nbytes
+    return total
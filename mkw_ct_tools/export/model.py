@@ -1,18 +1,34 @@
 
+from concurrent.futures import Executor, Future
 from dataclasses import dataclass, field
 
 import bpy
-from mathutils import Vector
+import numpy as np
 
 from ..model_settings import SCENE_PG_mkwctt_model_shader
 
 from .. import utils
-from .buffer import Buffer, V3F_ORDER, V3F_SCALE_ORDER
+from . import geometry
+from . import mesh_data
+from . import object_cache
+from . import output_stream
+from . import profiler
+from . import quantize
+from . import steps
+from .buffer import Buffer, V3F_ORDER, V3F_SCALE_ORDER, order_components
+from .error import ExportError
 from .string_table import StringTable
+from .texture_cache import TextureCache, texture_key
+from .write_jobs import WriteJobs
 
 
 DEFAULT_RESOURCE_NAME = "___Default___"
 
+COLOR_FORMAT_RGBA8 = 0x05
+
+MAX_LIST_COUNT = geometry.MAX_DRAW_COUNT // 3 * 3  # vertex count of the longest triangle list command
+MAX_ARRAY_COUNT = 0xFFFF  # 16-bit indices, the index 0xFFFF skips the vertex
+
 
 @dataclass
 class ModelTextureOutputInfo:
@@ -55,7 +71,10 @@ class ModelPartOutputInfo:
     name_off: int = 0
     mat_name_off: int = 0
 
-    inds: list = field(default_factory=list)
+    inds: np.ndarray = None
+    strips: np.ndarray = None  # vertex count of each strip at the start of inds, see geometry.build_strips
+    tri_count: int = 0
+    draw_size: int = 0
 
 
 @dataclass
@@ -67,20 +86,30 @@ class ModelObjectOutputInfo:
     name_off: int = 0
 
     verts_off: int = 0
-    verts: list = field(default_factory=list)
+    verts: np.ndarray = None
+    verts_format: quantize.ArrayFormat = field(default_factory=quantize.ArrayFormat)
 
     norms_off: int = 0
-    norms: list = field(default_factory=list)
+    norms: np.ndarray = None
+    norms_format: quantize.ArrayFormat = field(default_factory=quantize.ArrayFormat)
 
     colors_off: int = 0
     colors: list = field(default_factory=list)
 
     texcoords_off: int = 0
     texcoords: list = field(default_factory=list)
+    texcoords_formats: list = field(default_factory=list)  # one quantize.ArrayFormat per layer
+
+    index_sizes: list = field(default_factory=list)  # bytes per index into each array, in the order of the part indices
 
     parts_off: int = 0
     parts: dict = field(default_factory=dict)
 
+    geometry: object = None  # geometry.ModelGeometry, or a Future of it until finish_objects
+    cache_key: str = None  # key to store the geometry with in the object cache, if not from it
+
+    source: object = None  # ModelObjectOutputInfo of the first object of the same instance, whose arrays and parts are used
+
 
 @dataclass
 class ModelOutputInfo:
@@ -99,14 +128,22 @@ class ModelOutputInfo:
     objs_off: int = 0
     objs: list = field(default_factory=list)
 
+    sources: dict = field(default_factory=dict)  # object_cache.instance_key -> ModelObjectOutputInfo
+
 
 @dataclass
 class ModelsOutputInfo:
     size: int = 0
 
+    scale: float = 1.
+    position_tolerance: float = None  # quantize the arrays, keeping the scaled positions within this distance, or write floats if None
+
     models: list = field(default_factory=list)
 
 
+object_cache.register_persistent_type(geometry.ModelGeometry)
+
+
 def collect_textures(data: bpy.types.BlendData, info: ModelsOutputInfo, string_table: StringTable):
     for texture in data.textures:
         if texture.type != 'IMAGE':
@@ -162,134 +199,169 @@ def collect_materials(scene: bpy.types.Scene, info: ModelsOutputInfo, string_tab
                     shader_name = DEFAULT_RESOURCE_NAME
                 mat_info.shader_name_off = string_table[shader_name]
 
-def collect_objects(collection: bpy.types.Collection, info: ModelsOutputInfo, string_table: StringTable):
-    collection_settings = collection.mkwctt_collection_settings
-    if not collection_settings.has_model:
+def collect_object(obj: bpy.types.Object, model_info: ModelOutputInfo, string_table: StringTable, meshes: mesh_data.MeshArraysStore, cache: object_cache.ObjectCache = None, pool: Executor = None):
+    model_settings = obj.mkwctt_model_settings
+    if not model_settings.enable:
         return
 
-    if not collection_settings.is_skybox:
-        model_info = info.models[0]
-    else:
-        model_info = info.models[1]
+    obj_info = ModelObjectOutputInfo()
+    obj_info.obj = obj
+    obj_info.name_off = string_table[obj.name]
 
-    for obj in collection.objects:
-        if obj.type != 'MESH':
-            continue
+    key = object_cache.instance_key(obj)
+    obj_info.source = model_info.sources.get(key)  # e.g. a linked duplicate, only its transform is written
+    if obj_info.source is not None:
+        profiler.count(instances=1)
+        model_info.objs.append(obj_info)
+        return
+    model_info.sources[key] = obj_info
 
-        model_settings = obj.mkwctt_model_settings
-        if not model_settings.enable:
-            continue
+    if len(obj.material_slots) > 0:
+        for mat_slot in obj.material_slots:
+            if mat_slot.name not in model_info.mats:
+                continue
+
+            part_info = ModelPartOutputInfo()
+            part_info.name_off = string_table[obj.name + "___" + mat_slot.name]
+            part_info.mat_name_off = string_table[mat_slot.name]
+            part_info.size = 0x0D
+            obj_info.parts[mat_slot.slot_index] = part_info
 
-        obj_info = ModelObjectOutputInfo()
-        obj_info.obj = obj
-        obj_info.name_off = string_table[obj.name]
+    else:
+        part_info = ModelPartOutputInfo()
+        part_info.name_off = string_table[obj.name]
+        part_info.mat_name_off = string_table[DEFAULT_RESOURCE_NAME]
+        part_info.size = 0x0D
+        obj_info.parts[0] = part_info
+
+    mat_indices = list(obj_info.parts.keys())
+
+    if cache is not None:
+        key = object_cache.arrays_key(meshes[obj], 'model', mat_indices)
+        obj_info.geometry = cache.get(key)
+        if obj_info.geometry is not None:
+            profiler.count(cache_hits=1)
+        else:
+            obj_info.cache_key = key
 
-        mesh = obj.to_mesh()
+    if obj_info.geometry is None:
+        if pool is not None:
+            obj_info.geometry = pool.submit(geometry.build_geometry, meshes[obj], mat_indices)
+        else:
+            obj_info.geometry = geometry.build_geometry(meshes[obj], mat_indices)
 
-        vset = set()
-        nset = set()
-        for vert in mesh.vertices:
-            vset.add(Vector(vert.co).freeze())
-            nset.add(Vector(vert.normal).freeze())
+    model_info.objs.append(obj_info)
 
-        obj_info.verts = list(vset)
-        obj_info.norms = list(nset)
+def finish_object(obj_info: ModelObjectOutputInfo, model_info: ModelOutputInfo, cache: object_cache.ObjectCache = None, scale = 1., position_tolerance: float = None) -> bool:
+    obj = obj_info.obj
 
-        for color_layer in mesh.vertex_colors:
-            cset = set()
-            for color in color_layer.data:
-                cset.add(Vector(color.color).freeze())
+    if obj_info.source is not None:
+        obj_info.size = 0x3C
+        return len(obj_info.source.parts) > 0  # the parts of dropped objects are all removed
+
+    obj_geometry = obj_info.geometry
+    if isinstance(obj_geometry, Future):
+        obj_geometry = obj_geometry.result()
+    obj_info.geometry = None
+
+    if cache is not None and obj_info.cache_key is not None:
+        cache.put(obj_info.cache_key, obj_geometry)
+
+    profiler.count(
+        triangles=sum(geometry.triangle_count(obj_geometry.part_inds[mat_idx], obj_geometry.part_strips[mat_idx]) for mat_idx in obj_geometry.part_inds),
+        triangle_strips=sum(len(strips) for strips in obj_geometry.part_strips.values()),
+        unique_verts=len(obj_geometry.verts),
+    )
+
+    obj_info.verts = obj_geometry.verts
+    obj_info.norms = obj_geometry.norms
+    obj_info.colors = obj_geometry.colors
+    obj_info.texcoords = obj_geometry.texcoords
+
+    if position_tolerance is not None:
+        obj_info.verts_format = quantize.choose_position_format(obj_info.verts * scale, position_tolerance)
+        obj_info.norms_format = quantize.choose_normal_format(obj_info.norms)
+        obj_info.texcoords_formats = [quantize.choose_texcoord_format(texcoord_layer) for texcoord_layer in obj_info.texcoords]
+    else:
+        obj_info.texcoords_formats = [quantize.ArrayFormat() for _ in obj_info.texcoords]
+    profiler.count(quantized_arrays=sum(
+        array_format.fmt != quantize.FORMAT_F32
+        for array_format in [obj_info.verts_format, obj_info.norms_format] + obj_info.texcoords_formats
+    ))
 
-            obj_info.colors.append(list(cset))
-            if len(obj_info.colors) == 2:
-                break  # mdl0 support up to 2 vertex color layers per object
+    arrays = [("vertex positions", obj_info.verts), ("vertex normals", obj_info.norms)]
+    arrays += [("vertex colors", array) for array in obj_info.colors] + [("UV coordinates", array) for array in obj_info.texcoords]
+    for array_name, array in arrays:
+        if len(array) > MAX_ARRAY_COUNT:
+            raise ExportError(f"The object '{obj.name}' has {len(array):,} unique {array_name}, more than the {MAX_ARRAY_COUNT:,} a model object can have; split it into several objects.")
 
-        for uv_layer in mesh.uv_layers:
-            uvset = set()
-            for uv in uv_layer.data:
-                uvset.add(Vector(uv.uv).freeze())
+    obj_info.index_sizes = [index_size(len(array)) for _, array in arrays]
+    idx_size = sum(obj_info.index_sizes)
 
-            obj_info.texcoords.append(list(uvset))
-            if len(obj_info.texcoords) == 8:
-                break  # mdl0 support up to 8 texture coord layers per object
+    for mat_idx, part_info in obj_info.parts.items():
+        part_info.inds = obj_geometry.part_inds[mat_idx]
+        part_info.strips = obj_geometry.part_strips[mat_idx]
+        part_info.tri_count = geometry.triangle_count(part_info.inds, part_info.strips)
+        part_info.draw_size = draw_list_size(part_info.inds, part_info.strips, idx_size)
+        part_info.size += part_info.draw_size
 
-        if len(obj.material_slots) > 0:
-            for mat_slot in obj.material_slots:
-                if mat_slot.name not in model_info.mats:
-                    continue
+    for mat_idx in list(obj_info.parts.keys()):
+        if len(obj_info.parts[mat_idx].inds) == 0:
+            del obj_info.parts[mat_idx]
 
-                part_info = ModelPartOutputInfo()
-                part_info.name_off = string_table[obj.name + "___" + mat_slot.name]
-                part_info.mat_name_off = string_table[mat_slot.name]
-                part_info.size = 0x0C
-                obj_info.parts[mat_slot.slot_index] = part_info
+    if len(obj_info.parts) == 0:
+        return False
 
-        else:
-            part_info = ModelPartOutputInfo()
-            part_info.name_off = string_table[obj.name]
-            part_info.mat_name_off = string_table[DEFAULT_RESOURCE_NAME]
-            part_info.size = 0x0C
-            obj_info.parts[0] = part_info
+    obj_info.size = 0x3C
 
-        idx_size = 0x04 + len(obj_info.colors) * 0x02 + len(obj_info.texcoords) * 0x02
+    obj_info.verts_off = obj_info.size
+    obj_info.size += 0x08 + len(obj_info.verts) * 0x03 * obj_info.verts_format.component_size
 
-        mesh.calc_loop_triangles()
-        for tri in mesh.loop_triangles:
-            if tri.material_index not in obj_info.parts:
-                continue
+    obj_info.norms_off = obj_info.size
+    obj_info.size += 0x08 + len(obj_info.norms) * 0x03 * obj_info.norms_format.component_size
 
-            part_info = obj_info.parts[tri.material_index]
-            for vert, loop in zip(reversed(tri.vertices), reversed(tri.loops)):  # blender draws ccw while wii draws cw
-                idx = [
-                    obj_info.verts.index(Vector(mesh.vertices[vert].co)),
-                    obj_info.norms.index(Vector(mesh.vertices[vert].normal)),
-                ]
-                for layer_idx, layer in enumerate(obj_info.colors):
-                    idx.append(layer.index(Vector(mesh.vertex_colors[layer_idx].data[loop].color)))
-                for layer_idx, layer in enumerate(obj_info.texcoords):
-                    idx.append(layer.index(Vector(mesh.uv_layers[layer_idx].data[loop].uv)))
-                part_info.inds.append(idx)
-
-            part_info.size += idx_size * 3
-
-        for mat_idx in list(obj_info.parts.keys()):
-            if len(obj_info.parts[mat_idx].inds) == 0:
-                del obj_info.parts[mat_idx]
-
-        if len(obj_info.parts) == 0:
-            continue
+    obj_info.colors_off = obj_info.size
+    obj_info.size += 0x04
+    for color_layer in obj_info.colors:
+        obj_info.size += 0x08 + len(color_layer) * 0x04
 
-        obj_info.size = 0x3C
+    obj_info.texcoords_off = obj_info.size
+    obj_info.size += 0x04
+    for texcoord_layer, texcoord_format in zip(obj_info.texcoords, obj_info.texcoords_formats):
+        obj_info.size += 0x08 + len(texcoord_layer) * 0x02 * texcoord_format.component_size
 
-        obj_info.verts_off = obj_info.size
-        obj_info.size += 0x04 + len(obj_info.verts) * 0x0C
+    obj_info.parts_off = obj_info.size
+    parts_size = 0x04 + len(obj_info.parts) * 0x04
+    for mat_idx, part_info in obj_info.parts.items():
+        if len(obj.material_slots) > 0:
+            model_info.mats[obj.material_slots[mat_idx].name].use_count += 1
+        part_info.off = parts_size
+        parts_size += part_info.size
+    obj_info.size += parts_size
 
-        obj_info.norms_off = obj_info.size
-        obj_info.size += 0x04 + len(obj_info.norms) * 0x0C
+    return True
 
-        obj_info.colors_off = obj_info.size
-        obj_info.size += 0x04
-        for color_layer in obj_info.colors:
-            obj_info.size += 0x04 + len(color_layer) * 0x04
+def draw_list_size(inds: np.ndarray, strips: np.ndarray, idx_size: int) -> int:
+    list_count = len(inds) - int(strips.sum())
+    command_count = len(strips) + -(-list_count // MAX_LIST_COUNT)
+    return command_count * 0x03 + len(inds) * idx_size
 
-        obj_info.texcoords_off = obj_info.size
-        obj_info.size += 0x04
-        for texcoord_layer in obj_info.texcoords:
-            obj_info.size += 0x04 + len(texcoord_layer) * 0x08
+def index_size(count: int) -> int:
+    return 1 if count <= 0xFF else 2  # index 0xFF (0xFFFF) makes the gpu skip the vertex, so it is never used
 
-        obj_info.parts_off = obj_info.size
-        parts_size = 0x04 + len(obj_info.parts) * 0x04
-        for mat_idx, part_info in obj_info.parts.items():
-            if len(obj.material_slots) > 0:
-                model_info.mats[obj.material_slots[mat_idx].name].use_count += 1
-            part_info.off = parts_size
-            parts_size += part_info.size
-        obj_info.size += parts_size
+def finish_objects(info: ModelsOutputInfo, cache: object_cache.ObjectCache = None):
+    for model_info in info.models:
+        objs = []
+        for obj_info in model_info.objs:  # in the order they were added, not the order their geometry is built in
+            status = f"Finishing objects: {obj_info.obj.name}"
+            if isinstance(obj_info.geometry, Future):
+                obj_info.geometry = yield from steps.wait_future(obj_info.geometry, status)
 
-        model_info.objs.append(obj_info)
+            if finish_object(obj_info, model_info, cache, info.scale, info.position_tolerance):
+                objs.append(obj_info)
+            yield status
 
-    for coll in collection.children:
-        collect_objects(coll, info, string_table)
+        model_info.objs = objs
 
 def drop_unused_assets(model_info: ModelOutputInfo, string_table: StringTable):
     for mat_name in list(model_info.mats.keys()):
@@ -315,16 +387,26 @@ def drop_unused_assets(model_info: ModelOutputInfo, string_table: StringTable):
             del model_info.texs[tex_name]
 
 def get_output_info(context, string_table: StringTable):
+    export_settings = context.scene.mkwctt_export_settings
+
     info = ModelsOutputInfo()
+    info.scale = export_settings.scale
+    if export_settings.use_quantization:
+        info.position_tolerance = export_settings.quantization_tolerance * export_settings.scale
 
     info.models.append(ModelOutputInfo())  # course model
     info.models.append(ModelOutputInfo())  # skybox model
 
-    collect_textures(context.blend_data, info, string_table)
-    collect_shaders(context.scene, info, string_table)
-    collect_materials(context.scene, info, string_table)
-    collect_objects(context.scene.collection, info, string_table)
+    with profiler.phase("textures"):
+        collect_textures(context.blend_data, info, string_table)
+    with profiler.phase("shaders"):
+        collect_shaders(context.scene, info, string_table)
+    with profiler.phase("materials"):
+        collect_materials(context.scene, info, string_table)
 
+    return info
+
+def calc_layout(info: ModelsOutputInfo, string_table: StringTable):
     info.size = 0x08
 
     for model_info in info.models:
@@ -363,23 +445,67 @@ def get_output_info(context, string_table: StringTable):
         model_info.off = info.size
         info.size += model_info.size
 
-    return info
 
+def read_image_pixels(image: bpy.types.Image) -> np.ndarray:
+    pixels = np.empty(image.size[0] * image.size[1] * image.channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels
 
-def write_texture(tex_info: ModelTextureOutputInfo, out: Buffer):
-    model_settings = tex_info.tex.mkwctt_model_settings
+def quantize_pixels(pixels: np.ndarray, channels: int) -> np.ndarray:  # modifies `pixels`
+    if channels != 4:
+        width_height = len(pixels) // channels
+        pixels.shape = (width_height, channels)
+        rgba = np.ones((width_height, 4), dtype=np.float32)
+        rgba[:, :3] = pixels[:, :3] if channels >= 3 else pixels[:, :1]  # grayscale to rgb
+        if channels == 2:
+            rgba[:, 3] = pixels[:, 1]
+        pixels = rgba.reshape(-1)
 
-    out.put32(tex_info.name_off)
-    out.put32(tex_info.tex.image.size[0])
-    out.put32(tex_info.tex.image.size[1])
+    pixels *= 0xFF
+    np.rint(pixels, out=pixels)
+    np.clip(pixels, 0, 0xFF, out=pixels)
+
+    return pixels.astype(np.uint8)
+
+def write_texture_header(texture: bpy.types.Texture, out: Buffer):
+    model_settings = texture.mkwctt_model_settings
+
+    out.put32(texture.image.size[0])
+    out.put32(texture.image.size[1])
 
     out.put8(utils.get_enum_number(model_settings, 'format'))
     out.put8(1 if model_settings.gen_mipmaps else 0)
     out.put8(model_settings.gen_mipmap_count)
     out.put8(0)  # padding
 
-    for comp in tex_info.tex.image.pixels:
-        out.put8(int(comp * 0xFF))
+def write_texture_pixels(pixels: np.ndarray, channels: int, out: Buffer, cache: TextureCache = None, key: str = None):
+    out.puta(quantize_pixels(pixels, channels))
+    if cache is not None:
+        cache.put(key, out.view(pos=0))
+
+def write_texture(tex_info: ModelTextureOutputInfo, out: Buffer, cache: TextureCache = None, jobs: WriteJobs = None):
+    jobs = WriteJobs() if jobs is None else jobs
+
+    out.put32(tex_info.name_off)
+
+    image = tex_info.tex.image
+    pixels = read_image_pixels(image)
+
+    size = tex_info.size - 0x04
+    key = None
+    if cache is not None:
+        key = texture_key(tex_info.tex, pixels)
+
+        data = cache.get(key, size)
+        if data is not None:
+            out.puta(data)
+            profiler.count(cache_hits=1)
+            return
+
+    data_out = out.slice(size=size)
+    write_texture_header(tex_info.tex, data_out)
+    jobs.submit(write_texture_pixels, pixels, image.channels, data_out, cache, key)
+    out.pos += size
 
 def write_shader(shader_info: ModelShaderOutputInfo, out: Buffer):
     shader = shader_info.shader
@@ -431,101 +557,191 @@ def write_material(mat_info: ModelMaterialOutputInfo, out: Buffer):
         out.put8(utils.get_enum_number(layer, 'mag_filter'))
         out.put8(0)  # padding
 
-def write_v3f_array(data, scale, out: Buffer):
-    out.put32(len(data))
-    for vec in data:
-        out.putv(vec * scale, order=V3F_ORDER)
-
-def write_color_array(data, out: Buffer):
-    out.put32(len(data))
-    for vec in data:
-        for comp in vec:
-            out.put8(int(comp * 0xFF) & 0xFF)
-
-def write_uv_array(data, out: Buffer):
-    out.put32(len(data))
-    for vec in data:
-        out.putv(vec)
-
-def write_inds_array(data, out: Buffer):
-    out.put8(0x90)  # wii graphics code draw triangles command byte
-    out.put16(len(data))
-    for vert in data:
-        for idx in vert:
-            out.put16(idx)
+def write_array_header(count: int, fmt: int, shift: int, index_size: int, out: Buffer):
+    out.put32(count)
+    out.put8(fmt)
+    out.put8(shift)
+    out.put8(index_size)
+    out.put8(0)  # padding
+
+def write_components(data, array_format: quantize.ArrayFormat, out: Buffer):
+    if array_format.fmt == quantize.FORMAT_S8:
+        out.put_array_s8(quantize.quantize(data, array_format))
+    elif array_format.fmt == quantize.FORMAT_S16:
+        out.put_array_s16(quantize.quantize(data, array_format))
+    else:
+        out.put_array_f32(data)
+
+def write_v3f_array(data, scale, array_format: quantize.ArrayFormat, index_size: int, out: Buffer):
+    write_array_header(len(data), array_format.fmt, array_format.shift, index_size, out)
+    write_components(order_components(data * scale, V3F_ORDER), array_format, out)
+
+def write_color_array(data, index_size: int, out: Buffer):
+    write_array_header(len(data), COLOR_FORMAT_RGBA8, 0, index_size, out)
+    out.put_array_u8((data.astype(np.float64) * 0xFF).astype(np.int64) & 0xFF)
+
+def write_uv_array(data, array_format: quantize.ArrayFormat, index_size: int, out: Buffer):
+    write_array_header(len(data), array_format.fmt, array_format.shift, index_size, out)
+    write_components(data, array_format, out)
+
+def encode_inds(data, index_sizes: list) -> np.ndarray:
+    if len(data) > 0:
+        limits = np.array([(1 << (size * 8)) - 1 for size in index_sizes])
+        if (data.max(axis=0) >= limits).any():
+            raise ValueError("attribute index out of the range of its index size")
+
+    if all(size == 2 for size in index_sizes):
+        return data.astype('>u2').view(np.uint8).reshape(len(data), -1)
+
+    rows = np.empty((len(data), sum(index_sizes)), dtype=np.uint8)
+    col = 0
+    for attr_idx, size in enumerate(index_sizes):
+        if size == 2:
+            rows[:, col] = data[:, attr_idx] >> 8
+            col += 1
+        rows[:, col] = data[:, attr_idx] & 0xFF
+        col += 1
+    return rows
+
+def write_draw_list(data, strips, index_sizes: list, out: Buffer):
+    rows = encode_inds(data, index_sizes)
+    row_size = rows.shape[1]
+
+    list_start = int(strips.sum())
+    list_starts = np.arange(list_start, len(rows), MAX_LIST_COUNT)
+    counts = np.concatenate([strips, np.minimum(len(rows) - list_starts, MAX_LIST_COUNT)]).astype(np.int64)
+    commands = np.concatenate([
+        np.full(len(strips), 0x98, dtype=np.uint8),  # wii graphics code draw triangle strip command byte
+        np.full(len(list_starts), 0x90, dtype=np.uint8),  # wii graphics code draw triangles command byte
+    ])
+
+    # each command is its byte and its 16-bit row count, followed by its rows
+    header_pos = (np.cumsum(counts) - counts) * row_size + np.arange(len(commands)) * 3
+    draw_list = np.empty(len(rows) * row_size + len(commands) * 3, dtype=np.uint8)
+    draw_list[header_pos] = commands
+    draw_list[header_pos + 1] = counts >> 8
+    draw_list[header_pos + 2] = counts & 0xFF
+
+    is_row = np.ones(len(draw_list), dtype=bool)
+    is_row[header_pos] = is_row[header_pos + 1] = is_row[header_pos + 2] = False
+    draw_list[is_row] = rows.reshape(-1)
+
+    out.put_array_u8(draw_list)
     out.put8(0)  # padding
 
-def write_part(part_info: ModelPartOutputInfo, out: Buffer):
+def write_part(part_info: ModelPartOutputInfo, index_sizes: list, out: Buffer):
     out.put32(part_info.name_off)
     out.put32(part_info.mat_name_off)
+    out.put32(part_info.draw_size)
+
+    write_draw_list(part_info.inds, part_info.strips, index_sizes, out)
 
-    write_inds_array(part_info.inds, out)
+def write_object(obj_info: ModelObjectOutputInfo, scale, out: Buffer, jobs: WriteJobs = None):
+    jobs = WriteJobs() if jobs is None else jobs
 
-def write_object(obj_info: ModelObjectOutputInfo, scale, out: Buffer):
     out.put32(obj_info.name_off)
-    out.put32(obj_info.verts_off)
-    out.put32(obj_info.norms_off)
-    out.put32(obj_info.colors_off)
-    out.put32(obj_info.texcoords_off)
-    out.put32(obj_info.parts_off)
+    if obj_info.source is not None:
+        out.put32(0)  # no vertex array, marks an instance
+        out.put32(obj_info.source.off)  # offset of the source object in place of the normal array offset
+        out.put32(0)
+        out.put32(0)
+        out.put32(0)
+    else:
+        out.put32(obj_info.verts_off)
+        out.put32(obj_info.norms_off)
+        out.put32(obj_info.colors_off)
+        out.put32(obj_info.texcoords_off)
+        out.put32(obj_info.parts_off)
 
     out.putv(obj_info.obj.location * scale, order=V3F_ORDER)
     out.putv(obj_info.obj.rotation_euler, order=V3F_ORDER)
     out.putv(obj_info.obj.scale, order=V3F_SCALE_ORDER)
 
-    write_v3f_array(obj_info.verts, scale, out.slice(off=obj_info.verts_off))
-    write_v3f_array(obj_info.norms, 1., out.slice(off=obj_info.norms_off))
+    if obj_info.source is None:
+        jobs.submit(write_object_arrays, obj_info, scale, out)
+
+def write_object_arrays(obj_info: ModelObjectOutputInfo, scale, out: Buffer):
+    index_sizes = iter(obj_info.index_sizes)
+
+    write_v3f_array(obj_info.verts, scale, obj_info.verts_format, next(index_sizes), out.slice(off=obj_info.verts_off))
+    write_v3f_array(obj_info.norms, 1., obj_info.norms_format, next(index_sizes), out.slice(off=obj_info.norms_off))
 
     out.pos = obj_info.colors_off
     out.put32(len(obj_info.colors))
     for color_layer in obj_info.colors:
-        write_color_array(color_layer, out)
+        write_color_array(color_layer, next(index_sizes), out)
 
     out.pos = obj_info.texcoords_off
     out.put32(len(obj_info.texcoords))
-    for texcoord_layer in obj_info.texcoords:
-        write_uv_array(texcoord_layer, out)
+    for texcoord_layer, texcoord_format in zip(obj_info.texcoords, obj_info.texcoords_formats):
+        write_uv_array(texcoord_layer, texcoord_format, next(index_sizes), out)
 
     out = out.slice(off=obj_info.parts_off)
     out.put32(len(obj_info.parts))
     for part_info in obj_info.parts.values():
         out.put32(part_info.off)
-        write_part(part_info, out.slice(off=part_info.off))
-
-def write_model(model_info: ModelOutputInfo, scale, out: Buffer):
-    out.put32(model_info.texs_off)
-    out.put32(model_info.shaders_off)
-    out.put32(model_info.mats_off)
-    out.put32(model_info.objs_off)
-
-    out.pos = model_info.texs_off
-    out.put32(len(model_info.texs))
-    for tex_info in model_info.texs.values():
-        out.put32(tex_info.off)
-        write_texture(tex_info, out.slice(off=model_info.texs_off + tex_info.off))
-
-    out.pos = model_info.shaders_off
-    out.put32(len(model_info.shaders))
-    for shader_info in model_info.shaders.values():
-        out.put32(shader_info.off)
-        write_shader(shader_info, out.slice(off=model_info.shaders_off + shader_info.off))
-
-    out.pos = model_info.mats_off
-
-    out.put32(len(model_info.mats))
-    for mat_info in model_info.mats.values():
-        out.put32(mat_info.off)
-        write_material(mat_info, out.slice(off=model_info.mats_off + mat_info.off))
-
-    out.pos = model_info.objs_off
-    out.put32(len(model_info.objs))
-    for obj_info in model_info.objs:
-        out.put32(obj_info.off)
-        write_object(obj_info, scale, out.slice(off=model_info.objs_off + obj_info.off))
-
-def export_models(context, info: ModelsOutputInfo, out: Buffer):
+        write_part(part_info, obj_info.index_sizes, out.slice(off=part_info.off))
+
+def write_model(model_info: ModelOutputInfo, scale, out, tex_cache: TextureCache = None, jobs: WriteJobs = None):
+    header = output_stream.section(out, 0x00, 0x10)
+    header.put32(model_info.texs_off)
+    header.put32(model_info.shaders_off)
+    header.put32(model_info.mats_off)
+    header.put32(model_info.objs_off)
+
+    with profiler.phase("textures"):
+        table = output_stream.section(out, model_info.texs_off, 0x04 + len(model_info.texs) * 0x04)
+        table.put32(len(model_info.texs))
+        for tex_info in model_info.texs.values():
+            table.put32(tex_info.off)
+
+        for tex_info in model_info.texs.values():
+            with profiler.phase(tex_info.tex.name):
+                write_texture(tex_info, output_stream.section(out, model_info.texs_off + tex_info.off, tex_info.size), tex_cache, jobs)
+                profiler.count(bytes=tex_info.size)
+            yield f"Writing textures: {tex_info.tex.name}"
+
+    with profiler.phase("shaders"):
+        shaders_out = output_stream.section(out, model_info.shaders_off, model_info.mats_off - model_info.shaders_off)
+        shaders_out.put32(len(model_info.shaders))
+        for shader_info in model_info.shaders.values():
+            shaders_out.put32(shader_info.off)
+            write_shader(shader_info, shaders_out.slice(off=shader_info.off))
+        profiler.count(bytes=model_info.mats_off - model_info.shaders_off)
+    yield "Writing shaders"
+
+    with profiler.phase("materials"):
+        mats_out = output_stream.section(out, model_info.mats_off, model_info.objs_off - model_info.mats_off)
+        mats_out.put32(len(model_info.mats))
+        for mat_info in model_info.mats.values():
+            mats_out.put32(mat_info.off)
+            write_material(mat_info, mats_out.slice(off=mat_info.off))
+        profiler.count(bytes=model_info.objs_off - model_info.mats_off)
+    yield "Writing materials"
+
+    with profiler.phase("objects"):
+        table = output_stream.section(out, model_info.objs_off, 0x04 + len(model_info.objs) * 0x04)
+        table.put32(len(model_info.objs))
+        for obj_info in model_info.objs:
+            table.put32(obj_info.off)
+
+        for obj_info in model_info.objs:
+            write_object(obj_info, scale, output_stream.section(out, model_info.objs_off + obj_info.off, obj_info.size), jobs)
+            yield f"Writing objects: {obj_info.obj.name}"
+        profiler.count(bytes=model_info.size - model_info.objs_off)
+
+def export_models(context, info: ModelsOutputInfo, out, jobs: WriteJobs = None):
     export_settings = context.scene.mkwctt_export_settings
 
+    tex_cache = None
+    if export_settings.use_texture_cache:
+        tex_cache = TextureCache(max_size=export_settings.texture_cache_size * 1024 * 1024)
+
+    table = output_stream.section(out, 0x00, 0x08)
     for model_info in info.models:
-        out.put32(model_info.off)
-        write_model(model_info, export_settings.scale, out.slice(off=model_info.off, size=model_info.size))
+        table.put32(model_info.off)
+
+    for model_name, model_info in zip(("course", "skybox"), info.models):
+        with profiler.phase(model_name):
+            yield from write_model(model_info, export_settings.scale, out.slice(off=model_info.off, size=model_info.size), tex_cache, jobs)
+            profiler.count(bytes=model_info.size)
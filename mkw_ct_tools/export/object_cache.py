@@ -0,0 +1,267 @@
+
+import hashlib
+import os
+import pickle
+
+import bpy
+import numpy as np
+
+from .geometry import MeshArrays
+
+
+CACHE_VERSION = 3
+"""Bumped whenever the layout of the cached geometry changes."""
+
+CACHE_FILE_EXT = ".mkwctt_cache"
+
+
+def _pointer_value(value):
+    """
+    Return the value hashed for the ID `value`: its name, plus the world matrix
+    for objects since modifiers commonly depend on the placement of other
+    objects.
+    """
+    if isinstance(value, bpy.types.Object):
+        return (value.name_full, tuple(tuple(row) for row in value.matrix_world))
+    return value.name_full
+
+def _rna_signature(data) -> list:
+    """
+    Return the values of the RNA properties of `data`, e.g. a modifier, with ID
+    pointers replaced by `_pointer_value`.
+    """
+    signature = []
+    for prop in data.bl_rna.properties:
+        if prop.identifier == 'rna_type' or prop.type == 'COLLECTION':
+            continue
+
+        value = getattr(data, prop.identifier, None)
+        if prop.type == 'POINTER':
+            if isinstance(value, bpy.types.ID):
+                value = _pointer_value(value)
+            else:
+                continue  # nested structs
+
+        elif getattr(prop, 'is_array', False):
+            value = tuple(value)
+
+        elif isinstance(value, set):
+            value = tuple(sorted(value))  # enum flags
+
+        signature.append((prop.identifier, value))
+
+    return signature
+
+def _id_properties_signature(data) -> list:
+    """
+    Return the ID properties of `data`, such as the inputs of a Geometry Nodes
+    modifier, which are not RNA properties.
+    """
+    signature = []
+    for key in data.keys():
+        value = data[key]
+        if isinstance(value, bpy.types.ID):
+            value = _pointer_value(value)
+        elif hasattr(value, 'to_dict'):
+            value = value.to_dict()
+        elif hasattr(value, 'to_list'):
+            value = value.to_list()
+
+        signature.append((key, value))
+
+    return signature
+
+def _uses_placement(mod: bpy.types.Modifier) -> bool:
+    """
+    Return whether the result of `mod` can depend on the world matrix of its
+    own object: modifiers working relative to other objects or collections
+    (e.g. shrinkwrap, boolean), in global coordinates, or running geometry
+    nodes, which can read object transforms.
+    """
+    if mod.type == 'NODES':
+        return True
+
+    for prop in mod.bl_rna.properties:
+        value = getattr(mod, prop.identifier, None)
+        if prop.type == 'POINTER' and isinstance(value, (bpy.types.Object, bpy.types.Collection)):
+            return True
+        if prop.type == 'ENUM' and value == 'GLOBAL':
+            return True
+
+    return False
+
+def _modifiers_signature(obj: bpy.types.Object) -> str:
+    """
+    Return the properties and ID properties of the modifiers of `obj`, plus
+    its world matrix if any of them uses it, see `_uses_placement`.
+    """
+    signature = [(mod.type, _rna_signature(mod), _id_properties_signature(mod)) for mod in obj.modifiers]
+    if any(_uses_placement(mod) for mod in obj.modifiers):
+        signature.append(tuple(tuple(row) for row in obj.matrix_world))
+    return repr(signature)
+
+def arrays_key(arrays: MeshArrays, *extra) -> str:
+    """
+    Return a hash of `arrays`, read from the evaluated mesh of an object, which
+    is all the exported geometry depends on. Additional values that the cached
+    data depends on can be passed as `extra`.
+    """
+    h = hashlib.sha1()
+    h.update(repr((CACHE_VERSION, extra, len(arrays.colors), len(arrays.texcoords))).encode())
+
+    for data in [arrays.positions, arrays.normals, arrays.tri_verts, arrays.tri_loops, arrays.tri_mats] + arrays.colors + arrays.texcoords:
+        h.update(repr((data.dtype.str, data.shape)).encode())
+        h.update(np.ascontiguousarray(data))
+
+    return h.hexdigest()
+
+def instance_key(obj: bpy.types.Object) -> tuple:
+    """
+    Return a key shared by the objects whose exported geometry is the same in
+    object space during one export: the objects using the same mesh with the
+    same modifier stack and material slots, such as linked duplicates. Objects
+    with modifiers depending on their placement only share a key if they have
+    the same world matrix, see `_modifiers_signature`. Unlike `arrays_key`, the
+    mesh data is not hashed, so this is cheap, but only valid while the scene
+    does not change.
+    """
+    return (
+        obj.data.name_full,
+        _modifiers_signature(obj),
+        tuple((slot.link, slot.name) for slot in obj.material_slots),
+    )
+
+
+_PERSISTENT_TYPES = {
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.numeric', '_frombuffer'),
+    ('numpy._core.numeric', '_frombuffer'),
+}
+
+def register_persistent_type(cls):
+    """
+    Allow instances of `cls` to be loaded from a persisted cache file. Only
+    registered types are ever unpickled, so a cache file cannot run arbitrary
+    code.
+    """
+    _PERSISTENT_TYPES.add((cls.__module__, cls.__qualname__))
+    return cls
+
+
+class _CacheUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        if (module, name) not in _PERSISTENT_TYPES:
+            raise pickle.UnpicklingError(f"type not allowed in object cache: {module}.{name}")
+        return super().find_class(module, name)
+
+
+class ObjectCache:
+    """
+    Keep the geometry built from objects by previous exports, keyed by
+    `arrays_key`, so objects whose evaluated mesh did not change since are not
+    built again.
+
+    Calling `begin` before an export and `prune` after it drops the entries of
+    objects which were not part of that export, so the cache does not grow
+    indefinitely over a session.
+    """
+
+    def __init__(self):
+        self._entries = dict()
+        self._used = set()
+        self._loaded_from = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        value = self._entries.get(key)
+        if value is not None:
+            self._used.add(key)
+        return value
+
+    def put(self, key: str, value):
+        self._entries[key] = value
+        self._used.add(key)
+
+    def begin(self):
+        self._used.clear()
+
+    def prune(self):
+        for key in list(self._entries.keys()):
+            if key not in self._used:
+                del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+        self._used.clear()
+
+    def load(self, filepath: str):
+        """
+        Add the entries persisted in `filepath` by `save`, unless this file was
+        already loaded. Unreadable or outdated files are ignored.
+        """
+        if self._loaded_from == filepath:
+            return
+        self._loaded_from = filepath
+
+        try:
+            with open(filepath, 'rb') as file:
+                version, entries = _CacheUnpickler(file).load()
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+            return
+
+        if version == CACHE_VERSION:
+            for key, value in entries.items():
+                self._entries.setdefault(key, value)
+
+    def save(self, filepath: str):
+        tmp_path = filepath + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                pickle.dump((CACHE_VERSION, self._entries), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, filepath)
+        except OSError:
+            pass  # a cache which cannot be saved is only rebuilt next time
+        self._loaded_from = filepath
+
+
+_session_cache = ObjectCache()
+
+def cache_filepath(context) -> str:
+    """
+    Return the path of the persisted cache next to the .blend file, or `None`
+    if the .blend file was never saved.
+    """
+    blend_filepath = context.blend_data.filepath
+    return blend_filepath + CACHE_FILE_EXT if blend_filepath else None
+
+def begin_export(context):
+    """
+    Return the object cache to use for the export, or `None` if disabled in the
+    export settings.
+    """
+    export_settings = context.scene.mkwctt_export_settings
+    if not export_settings.use_object_cache:
+        return None
+
+    filepath = cache_filepath(context)
+    if export_settings.persist_object_cache and filepath is not None:
+        _session_cache.load(filepath)
+
+    _session_cache.begin()
+    return _session_cache
+
+def end_export(context, cache: ObjectCache):
+    if cache is None:
+        return
+
+    cache.prune()
+
+    filepath = cache_filepath(context)
+    if context.scene.mkwctt_export_settings.persist_object_cache and filepath is not None:
+        cache.save(filepath)
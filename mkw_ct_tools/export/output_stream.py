@@ -0,0 +1,116 @@
+
+from .buffer import Buffer
+from .write_jobs import WriteJobs
+
+
+MAX_PENDING_SIZE = 32 * 1024 * 1024  # bytes of written sections kept in memory before flushing
+
+
+class OutputStream:
+    """
+    Write the output file section by section, instead of building the whole
+    output in memory first. Each section is written to its own `Buffer`, and
+    the pending sections are written to the file at their offset once more than
+    `max_pending_size` bytes are pending, or when calling `flush`. Only the
+    pending sections are held in memory, regardless of the size of the output.
+
+    A stream can be sliced like a `Buffer`, which creates a stream over a
+    subset of the file sharing the same pending sections. The regions of the
+    file which are not covered by any section are left zeroed.
+
+    The file may also be a pipe, such as the input of the builder, in which
+    case the sections must be requested in layout order, since they are
+    written one after the other instead of at their offset.
+    """
+
+    def __init__(self, file, size: int, jobs: WriteJobs = None, max_pending_size: int = MAX_PENDING_SIZE):
+        self._file = file
+        self._seekable = file.seekable()
+        if self._seekable:
+            self._file.truncate(size)
+        self._jobs = WriteJobs() if jobs is None else jobs
+
+        self._pending = []  # [absolute offset, Buffer]
+        self._pending_size = 0
+        self._max_pending_size = max_pending_size
+        self._file_pos = 0
+
+        self._off = 0
+        self._size = size
+        self._root = self
+
+        self.written = 0
+
+    def __len__(self):
+        return self._size
+
+    def _check(self, off: int, size: int):
+        if off < 0 or size < 0 or off + size > self._size:
+            raise ValueError(f"section out of the stream bounds; {off=}, {size=}, {self._size=}")
+
+    def slice(self, *, off: int, size: int):
+        """Return a stream over the `size` bytes at `off` in this stream."""
+        self._check(off, size)
+
+        stream = object.__new__(OutputStream)
+        stream._off = self._off + off
+        stream._size = size
+        stream._root = self._root
+        return stream
+
+    def section(self, *, off: int, size: int) -> Buffer:
+        """
+        Return a new buffer for the `size` bytes at `off` in this stream. The
+        buffer is written to the file when the stream is flushed, which may
+        happen when requesting the next section, so it must be filled, either
+        directly or by submitting jobs, before requesting another one.
+        """
+        self._check(off, size)
+
+        root = self._root
+        if root._pending_size + size > root._max_pending_size:
+            root.flush()
+
+        out = Buffer(size=size)
+        root._pending.append((self._off + off, out))
+        root._pending_size += size
+        return out
+
+    def flush(self):
+        """Wait for the pending jobs, then write the pending sections in layout order."""
+        root = self._root
+        root._jobs.wait()
+
+        for off, out in sorted(root._pending, key=lambda section: section[0]):
+            if root._seekable:
+                root._file.seek(off)
+            elif off < root._file_pos:
+                raise ValueError(f"section before the end of the pipe; {off=}, {root._file_pos=}")
+            elif off > root._file_pos:
+                root._file.write(bytes(off - root._file_pos))
+
+            root._file.write(out.data)
+            root._file_pos = off + len(out)
+            root.written += len(out)
+
+        root._pending.clear()
+        root._pending_size = 0
+
+    def close(self):
+        """Flush the stream, then pad a pipe with zeros up to the size of the stream."""
+        self.flush()
+
+        root = self._root
+        if not root._seekable and root._file_pos < root._size:
+            root._file.write(bytes(root._size - root._file_pos))
+            root._file_pos = root._size
+
+
+def section(out, off: int, size: int) -> Buffer:
+    """
+    Return a buffer for the `size` bytes at `off` in `out`, which is either a
+    `Buffer` or an `OutputStream`.
+    """
+    if isinstance(out, OutputStream):
+        return out.section(off=off, size=size)
+    return out.slice(off=off, size=size)
@@ -0,0 +1,261 @@
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+
+@dataclass
+class PhaseStats:
+    name: str = ""
+    depth: int = 0
+
+    calls: int = 0
+    wall_time: float = 0.  # seconds
+    peak_memory: int = 0  # bytes, highest traced memory while in the phase
+
+    counts: dict = field(default_factory=dict)
+
+
+class Profiler:
+    """
+    Record the wall time, peak memory and counters (triangles, bytes, ...) of
+    the named phases of an export.
+
+    Phases nest: the name of a phase entered while another one is active is
+    prefixed by the name of the outer phase, separated by a '/'. Entering a
+    phase with the same full name again accumulates into the same stats.
+
+    Peak memory is measured with `tracemalloc`, so it only accounts for the
+    memory allocated by Python code, including NumPy arrays, but not for the
+    memory allocated by Blender itself.
+
+    Only the thread which started the profiler is recorded, the phases and
+    counts of the jobs run by other threads are ignored.
+
+    While paused, e.g. when Blender's UI runs between two slices of the export,
+    the memory allocated is not recorded, and unless told otherwise, the time
+    spent is not added to the active phases.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self._phases = dict()  # full name -> PhaseStats, in order of first entry
+        self._stack = []  # [PhaseStats, peak memory of nested phases]
+        self._trace_memory = trace_memory
+        self._started_tracing = False
+        self._thread_id = threading.get_ident()
+        self._paused_time = 0.  # seconds, total time paused
+        self._pause_start = None
+        self._pause_keeps_time = False
+
+    @property
+    def phases(self) -> list:
+        return list(self._phases.values())
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _take_peak(self) -> int:
+        """Return the peak traced memory since the last call and reset it."""
+        if not tracemalloc.is_tracing():
+            return 0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return peak
+
+    def pause(self, keep_time: bool = False):
+        """
+        Pause recording until `resume`. If `keep_time`, the time paused is still
+        added to the active phases, e.g. while other threads work for them.
+        """
+        if self._pause_start is not None or threading.get_ident() != self._thread_id:
+            return
+
+        self._pause_start = time.perf_counter()
+        self._pause_keeps_time = keep_time
+        if len(self._stack) > 0:
+            parent = self._stack[-1]
+            parent[1] = max(parent[1], self._take_peak())
+
+    def resume(self):
+        if self._pause_start is None or threading.get_ident() != self._thread_id:
+            return
+
+        if not self._pause_keeps_time:
+            self._paused_time += time.perf_counter() - self._pause_start
+        self._pause_start = None
+        self._take_peak()  # drop the memory allocated while paused
+
+    @contextmanager
+    def phase(self, name: str):
+        if threading.get_ident() != self._thread_id:
+            yield None
+            return
+
+        if len(self._stack) > 0:
+            parent = self._stack[-1]
+            parent[1] = max(parent[1], self._take_peak())
+            name = parent[0].name + "/" + name
+        else:
+            self._take_peak()
+
+        stats = self._phases.get(name)
+        if stats is None:
+            stats = PhaseStats(name=name, depth=len(self._stack))
+            self._phases[name] = stats
+
+        self._stack.append([stats, 0])
+        start = time.perf_counter()
+        paused_time = self._paused_time
+        try:
+            yield stats
+        finally:
+            stats.wall_time += time.perf_counter() - start - (self._paused_time - paused_time)
+            stats.calls += 1
+
+            _, nested_peak = self._stack.pop()
+            peak = max(nested_peak, self._take_peak())
+            stats.peak_memory = max(stats.peak_memory, peak)
+
+            if len(self._stack) > 0:
+                parent = self._stack[-1]
+                parent[1] = max(parent[1], peak)
+
+    def count(self, **counts):
+        """Add `counts` to the counters of the innermost active phase."""
+        if len(self._stack) == 0 or threading.get_ident() != self._thread_id:
+            return
+
+        stats = self._stack[-1][0]
+        for key, value in counts.items():
+            stats.counts[key] = stats.counts.get(key, 0) + value
+
+    def format_table(self) -> str:
+        rows = [("Phase", "Calls", "Time (ms)", "Peak (MB)", "Counts")]
+        for stats in self._phases.values():
+            rows.append((
+                "  " * stats.depth + stats.name.rsplit("/", 1)[-1],
+                str(stats.calls),
+                f"{stats.wall_time * 1000.:.1f}",
+                f"{stats.peak_memory / (1024 * 1024):.1f}" if self._trace_memory else "-",
+                ", ".join(f"{key}={value}" for key, value in stats.counts.items()),
+            ))
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = []
+        for row in rows:
+            cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:-1], widths[1:-1])] + [row[-1]]
+            lines.append("  ".join(cells).rstrip())
+        lines.insert(1, "-" * len(lines[0]))
+
+        return "\n".join(lines)
+
+    def save_json(self, filepath: str, **metadata):
+        """
+        Save the stats of every phase to `filepath`, along with `metadata` such
+        as the add-on version, so reports of different versions can be compared.
+        """
+        data = dict(metadata)
+        data['phases'] = [asdict(stats) for stats in self._phases.values()]
+        with open(filepath, 'w') as file:
+            json.dump(data, file, indent=2)
+
+
+def peak_process_memory() -> int:
+    """
+    Return the peak resident memory of the whole process (i.e. Blender) in
+    bytes, or `None` if it cannot be queried on this platform.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_current_process.restype = wintypes.HANDLE
+        get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if not get_process_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes except on macos
+
+
+_active = None
+
+@contextmanager
+def session(enable: bool = True, trace_memory: bool = True):
+    """
+    Make a new `Profiler` the target of `phase` and `count` for the duration of
+    the `with` block, and yield it. If `enable` is false, yield `None` and leave
+    `phase` and `count` disabled.
+    """
+    global _active
+    if not enable:
+        yield None
+        return
+
+    prev = _active
+    _active = Profiler(trace_memory=trace_memory)
+    _active.start()
+    try:
+        yield _active
+    finally:
+        _active.stop()
+        _active = prev
+
+@contextmanager
+def phase(name: str):
+    """Record the `with` block as phase `name` of the active profiler, if any."""
+    if _active is None:
+        yield None
+        return
+
+    with _active.phase(name) as stats:
+        yield stats
+
+def count(**counts):
+    if _active is not None:
+        _active.count(**counts)
+
+def pause(keep_time: bool = False):
+    if _active is not None:
+        _active.pause(keep_time)
+
+def resume():
+    if _active is not None:
+        _active.resume()
@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+import math
+
+import numpy as np
+
+
+# Component formats of the MDL0 vertex arrays, as numbered by the game
+FORMAT_S8 = 0x01
+FORMAT_S16 = 0x03
+FORMAT_F32 = 0x04
+
+_DTYPES = {
+    FORMAT_S8: np.int8,
+    FORMAT_S16: np.int16,
+    FORMAT_F32: np.float32,
+}
+
+MAX_SHIFT = 15
+
+POSITION_CANDIDATES = [(FORMAT_S8, None), (FORMAT_S16, None)]
+NORMAL_CANDIDATES = [(FORMAT_S16, 14)]  # the console ignores the shift of normal arrays and uses this one
+NORMAL_TOLERANCE = 1. / 1024.
+TEXCOORD_CANDIDATES = [(FORMAT_S16, None)]
+TEXCOORD_TOLERANCE = 1. / 4096.
+
+
+@dataclass
+class ArrayFormat:
+    fmt: int = FORMAT_F32
+    shift: int = 0  # integer components are divided by 2 ^ shift in game
+
+    @property
+    def component_size(self) -> int:
+        return np.dtype(_DTYPES[self.fmt]).itemsize
+
+
+def max_shift(data: np.ndarray, fmt: int) -> int:
+    """
+    Return the largest shift at which every component of `data` fits in the
+    integer format `fmt`, or -1 if none does.
+    """
+    max_abs = float(np.abs(data).max()) if data.size > 0 else 0.
+    if max_abs == 0.:
+        return MAX_SHIFT
+    return min(MAX_SHIFT, math.floor(math.log2(np.iinfo(_DTYPES[fmt]).max / max_abs)))
+
+def quantize(data: np.ndarray, array_format: ArrayFormat) -> np.ndarray:
+    """Return the components of `data` in `array_format`."""
+    if array_format.fmt == FORMAT_F32:
+        return data.astype(np.float32)
+
+    quantized = np.rint(data * float(1 << array_format.shift))
+    limits = np.iinfo(_DTYPES[array_format.fmt])
+    np.clip(quantized, limits.min, limits.max, out=quantized)
+    return quantized.astype(_DTYPES[array_format.fmt])
+
+def choose_format(data: np.ndarray, tolerance: float, candidates: list) -> ArrayFormat:
+    """
+    Return the first of the `(format, shift)` `candidates` which keeps every
+    component of `data` within `tolerance`, or floats if none does. A shift of
+    `None` stands for the largest shift the range of `data` allows.
+    """
+    for fmt, shift in candidates:
+        if shift is None:
+            shift = max_shift(data, fmt)
+            if shift < 0:
+                continue
+
+        array_format = ArrayFormat(fmt, shift)
+        if data.size == 0:
+            return array_format
+
+        error = np.abs(quantize(data, array_format) / float(1 << shift) - data).max()
+        if error <= tolerance:
+            return array_format
+
+    return ArrayFormat()
+
+def choose_position_format(data: np.ndarray, tolerance: float) -> ArrayFormat:
+    return choose_format(data, tolerance, POSITION_CANDIDATES)
+
+def choose_normal_format(data: np.ndarray) -> ArrayFormat:
+    return choose_format(data, NORMAL_TOLERANCE, NORMAL_CANDIDATES)
+
+def choose_texcoord_format(data: np.ndarray) -> ArrayFormat:
+    return choose_format(data, TEXCOORD_TOLERANCE, TEXCOORD_CANDIDATES)
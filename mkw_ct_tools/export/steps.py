@@ -0,0 +1,95 @@
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+import subprocess
+
+from . import profiler
+from .write_jobs import WriteJobs
+
+
+POLL_INTERVAL = 0.01  # seconds
+
+
+def run(steps):
+    """
+    Run all of `steps` and return the value returned by the generator.
+
+    The export is written as generators of steps, so it can either run at once
+    with this function, or a few steps at a time from a modal operator, without
+    blocking Blender's UI for the whole export. Each step yields a short status
+    text describing what is being done, such as the object being collected.
+
+    Waiting for work done in other threads or processes also yields, at least
+    every `POLL_INTERVAL` seconds, instead of blocking until the work is done.
+    """
+    while True:
+        try:
+            next(steps)
+        except StopIteration as ex:
+            return ex.value
+
+
+class Waiting(str):
+    """
+    Status of a step waiting for another thread or process, whose work goes on
+    while the steps are suspended.
+    """
+
+
+def exclude_suspended(steps):
+    """
+    Run `steps` like `yield from`, pausing the active profiler while they are
+    suspended. The time suspended while waiting for other threads or processes
+    is still recorded, since their work goes on meanwhile.
+    """
+    try:
+        while True:
+            try:
+                status = next(steps)
+            except StopIteration as ex:
+                return ex.value
+
+            profiler.pause(keep_time=isinstance(status, Waiting))
+            try:
+                yield status
+            finally:
+                profiler.resume()
+    finally:
+        steps.close()
+
+def wait_future(future: Future, status: str):
+    """Wait for `future` and return its result."""
+    while True:
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except TimeoutError:
+            yield Waiting(status)
+
+def wait_jobs(jobs: WriteJobs, status: str):
+    while not jobs.wait(timeout=POLL_INTERVAL):
+        yield Waiting(status)
+
+def run_in_thread(status: str, fn, *args):
+    """
+    Run `fn(*args)` in a new thread and return its result. If the steps are
+    closed before, the thread is left to finish on its own.
+    """
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(fn, *args)
+    pool.shutdown(wait=False)
+    return (yield from wait_future(future, status))
+
+def wait_process(process: subprocess.Popen, status: str):
+    """
+    Wait for `process` to exit and return its exit status. If the steps are
+    closed before, such as when the export is cancelled, `process` is killed.
+    """
+    try:
+        while True:
+            try:
+                return process.wait(timeout=POLL_INTERVAL)
+            except subprocess.TimeoutExpired:
+                yield Waiting(status)
+    except GeneratorExit:
+        process.kill()
+        process.wait()
+        raise
@@ -0,0 +1,132 @@
+
+import hashlib
+import os
+
+import bpy
+import numpy as np
+
+from .. import utils
+
+
+CACHE_VERSION = 1
+"""Bumped whenever the layout of the cached texture data changes."""
+
+CACHE_SUBDIR = "mkw_ct_tools/texture_cache"
+
+CACHE_FILE_EXT = ".bin"
+
+
+def default_directory() -> str:
+    return bpy.utils.user_resource('DATAFILES', path=CACHE_SUBDIR, create=True)
+
+def texture_key(texture: bpy.types.Texture, pixels: np.ndarray) -> str:
+    """
+    Return the cache key of the data of `texture`, derived from the texture
+    settings and from `pixels`, the pixels read from its image which are
+    encoded. The image file itself is not used, since Blender may hold pixels
+    different from the file until the image is reloaded.
+    """
+    image = texture.image
+    model_settings = texture.mkwctt_model_settings
+
+    h = hashlib.sha1()
+    h.update(repr((
+        CACHE_VERSION,
+        tuple(image.size),
+        image.channels,
+        image.alpha_mode,
+        image.colorspace_settings.name,
+        utils.get_enum_number(model_settings, 'format'),
+        model_settings.gen_mipmaps,
+        model_settings.gen_mipmap_count,
+    )).encode())
+    h.update(pixels)
+
+    return h.hexdigest()
+
+
+class TextureCache:
+    """
+    Store the ready-to-write data of textures on disk so unchanged textures do
+    not have to be read and quantized again on the next export.
+
+    Each entry is a file named after its key in `directory`. Reading an entry
+    updates its modification time, and when the total size of the entries
+    exceeds `max_size` bytes, the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory: str = None, max_size: int = 512 * 1024 * 1024):
+        self._dir = default_directory() if directory is None else directory
+        self._max_size = max_size
+
+    @property
+    def directory(self) -> str:
+        return self._dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._dir, key + CACHE_FILE_EXT)
+
+    def _entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self._dir):
+            if entry.is_file() and entry.name.endswith(CACHE_FILE_EXT):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # evicted by another writer meanwhile
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def get(self, key: str, size: int):
+        """
+        Return the data stored for `key`, or `None` if there is none or if its
+        size is not `size` bytes.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            return None
+
+        return data if len(data) == size else None
+
+    def put(self, key: str, data):
+        """
+        Store `data`, any object supporting the buffer protocol, for `key`, then
+        evict the least recently used entries if the cache is over capacity.
+        """
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        self.evict()
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+    def purge(self) -> int:
+        """Delete every entry and return the number of bytes freed."""
+        freed = 0
+        for _, size, path in self._entries():
+            try:
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        return freed
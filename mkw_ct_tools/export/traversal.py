@@ -0,0 +1,90 @@
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+
+import bpy
+
+from . import collision
+from . import mesh_data
+from . import model
+from . import object_cache
+from . import profiler
+from .string_table import StringTable
+
+
+@dataclass
+class TraversalResult:
+    duplicate_collections: list = field(default_factory=list)  # names of the collections reached again through another parent
+    duplicate_objects: list = field(default_factory=list)  # names of the objects reached again through another collection
+
+
+def collect_objects(layer_collection: bpy.types.LayerCollection, models_info: model.ModelsOutputInfo, collision_info: collision.CollisionOutputInfo, string_table: StringTable, scale, meshes: mesh_data.MeshArraysStore, cache: object_cache.ObjectCache = None, pool: Executor = None, has_model: bool = True, has_collision: bool = True):
+    """
+    Walk the collection of `layer_collection` and its children once, passing
+    every mesh object to the model and collision builders, and return a
+    `TraversalResult`. The mesh of each object is evaluated at most once, and
+    its arrays are released as soon as both builders are done with it.
+
+    Collections excluded from the view layer are skipped along with their
+    children. A collection linked under several parents is only walked the
+    first time it is reached, and an object linked into several collections is
+    only added once to each builder; the skipped duplicates are listed in the
+    result.
+
+    If `pool` is given, the model geometry is built in it, see
+    `model.collect_object`.
+
+    Like the collection settings, `has_model` and `has_collision` apply to the
+    whole subtree: children of a collection without model or collision are
+    excluded from it as well.
+    """
+    result = TraversalResult()
+    visited_collections = set()  # (name, has_model, has_collision), as a collection reached with other settings exports differently
+    model_objects = set()
+    collision_objects = set()
+
+    stack = [(layer_collection, has_model, has_collision)]
+    while len(stack) > 0:
+        layer_collection, has_model, has_collision = stack.pop()
+        if layer_collection.exclude:
+            continue
+
+        collection = layer_collection.collection
+        collection_settings = collection.mkwctt_collection_settings
+        has_model = has_model and collection_settings.has_model
+        has_collision = has_collision and collection_settings.has_collision
+        if not has_model and not has_collision:
+            continue
+
+        key = (collection.name_full, has_model, has_collision)
+        if key in visited_collections:
+            result.duplicate_collections.append(collection.name_full)
+            continue
+        visited_collections.add(key)
+
+        model_info = models_info.models[1 if collection_settings.is_skybox else 0]
+
+        for obj in collection.objects:
+            if obj.type != 'MESH':
+                continue
+
+            add_model = has_model and obj.name_full not in model_objects
+            add_collision = has_collision and obj.name_full not in collision_objects
+            if not add_model and not add_collision:
+                result.duplicate_objects.append(obj.name_full)
+                continue
+
+            with profiler.phase(obj.name):
+                if add_model:
+                    model.collect_object(obj, model_info, string_table, meshes, cache, pool)
+                    model_objects.add(obj.name_full)
+                if add_collision:
+                    collision.collect_object(obj, scale, collision_info, meshes, cache)
+                    collision_objects.add(obj.name_full)
+                meshes.release(obj)
+
+            yield f"Collecting objects: {obj.name}"
+
+        # reversed, so children are popped and walked in order, depth first
+        stack.extend((child, has_model, has_collision) for child in reversed(layer_collection.children))
+
+    return result
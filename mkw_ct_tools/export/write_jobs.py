@@ -0,0 +1,49 @@
+
+from concurrent.futures import Executor, TimeoutError
+import threading
+
+
+class WriteJobs:
+    """
+    Run the functions writing disjoint parts of the output buffer, either right
+    away, or in `pool` if one is given. Since the writes never overlap, the
+    output is the same regardless of the order the jobs run in.
+
+    Jobs run in the pool must not access Blender data, which is not thread
+    safe: everything they need must be read beforehand by the caller. Jobs may
+    submit more jobs, but must not wait for them.
+    """
+
+    def __init__(self, pool: Executor = None):
+        self._pool = pool
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        if self._pool is None:
+            fn(*args)
+            return
+
+        future = self._pool.submit(fn, *args)
+        with self._lock:
+            self._futures.append(future)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait for every job, including the ones submitted by other jobs while
+        waiting, and raise the first error raised by a job, if any. If
+        `timeout` is given, return `False` if jobs are still running after
+        about `timeout` seconds, otherwise return `True`.
+        """
+        idx = 0
+        while True:
+            with self._lock:
+                if idx == len(self._futures):
+                    return True
+                future = self._futures[idx]
+
+            try:
+                future.result(timeout=timeout)
+            except TimeoutError:
+                return False
+            idx += 1
@@ -1,7 +1,9 @@
 
+import time
+
 import bpy
 
-from .export import ExportError, export_manager
+from .export import ExportError, export_manager, texture_cache
 
 
 class SCENE_PG_mkwctt_export_settings(bpy.types.PropertyGroup):
@@ -12,23 +14,187 @@ class SCENE_PG_mkwctt_export_settings(bpy.types.PropertyGroup):
         precision=0,
     )
 
+    use_quantization: bpy.props.BoolProperty(
+        name="Quantize Vertices",
+        description="Store the vertex positions, normals and texture coordinates of each object as 8-bit or 16-bit fixed point numbers when precise enough, instead of floats",
+        default=False,
+    )
+
+    quantization_tolerance: bpy.props.FloatProperty(
+        name="Position Tolerance",
+        description="The maximum distance a quantized vertex may be moved by, before the track scale",
+        subtype='DISTANCE',
+        min=0., default=0.001,
+        precision=4,
+    )
+
+    use_texture_cache: bpy.props.BoolProperty(
+        name="Cache Textures",
+        description="Reuse the texture data of previous exports when neither the image nor its settings changed",
+        default=True,
+    )
+
+    texture_cache_size: bpy.props.IntProperty(
+        name="Texture Cache Size",
+        description="The maximum size of the texture cache on disk, in megabytes. The least recently used textures are removed first",
+        min=0, default=512,
+    )
+
+    use_object_cache: bpy.props.BoolProperty(
+        name="Cache Objects",
+        description="Reuse the geometry built from objects by previous exports when their evaluated mesh did not change",
+        default=False,
+    )
+
+    persist_object_cache: bpy.props.BoolProperty(
+        name="Save Object Cache",
+        description="Save the object cache next to the .blend file so it is reused after reopening the file",
+        default=False,
+    )
+
+    use_multiprocessing: bpy.props.BoolProperty(
+        name="Parallel Geometry",
+        description="Build the geometry of the objects in worker processes, using multiple CPU cores",
+        default=False,
+    )
+
+    worker_count: bpy.props.IntProperty(
+        name="Worker Processes",
+        description="The number of worker processes building geometry. 0 uses one per CPU core",
+        min=0, default=0,
+    )
+
+    use_parallel_write: bpy.props.BoolProperty(
+        name="Parallel Writing",
+        description="Write the textures, object arrays and collision of the output in multiple threads",
+        default=False,
+    )
+
+    use_streaming_write: bpy.props.BoolProperty(
+        name="Stream Output",
+        description="Write the output file section by section instead of building it whole in memory first, which lowers the memory usage for large tracks",
+        default=False,
+    )
+
+    keep_intermediate_file: bpy.props.BoolProperty(
+        name="Keep .szs.data",
+        description="Write the intermediate .szs.data file next to the archive, for debugging, instead of piping the data straight to the builder",
+        default=False,
+    )
+
+    enable_profiling: bpy.props.BoolProperty(
+        name="Profile Export",
+        description="Measure the time, memory and amount of data of each phase of the export, and print a report to the info log",
+        default=False,
+    )
+
+    profile_filepath: bpy.props.StringProperty(
+        name="Profile Report",
+        description="The JSON file to save the profiling report to. Leave empty to only print the report",
+        subtype='FILE_PATH',
+    )
+
 
 class SCENE_OT_mkwctt_export(bpy.types.Operator):
+    """
+    Export the scene a few steps at a time from a timer, so Blender's UI keeps
+    redrawing and shows the progress in the status bar. The geometry and most
+    of the output are built in other threads, the steps only read Blender data
+    and poll them. Pressing Esc cancels
+    the export. Other events are blocked until the export is done, since the
+    scene must not be edited while it is being exported.
+    """
+
     bl_idname = 'scene.mkwctt_export'
     bl_label = "Export"
     bl_description = "Export this blender project as an SZS archive"
 
     directory: bpy.props.StringProperty(subtype='DIR_PATH')
 
+    TIMER_INTERVAL = 0.02  # seconds between two slices of the export
+    TIME_SLICE = 0.05  # seconds of export steps run per timer event
+
+    _steps = None
+    _timer = None
+
     def invoke(self, context, event):
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
     def execute(self, context):
+        if context.window is None:  # not run from the UI, e.g. in background mode
+            try:
+                result = export_manager.export(context, self.directory)
+            except ExportError as ex:
+                self.report({'ERROR'}, ex.args[0])
+                return {'FINISHED'}
+
+            self.report_result(result)
+            return {'FINISHED'}
+
+        self._steps = export_manager.export_steps(context, self.directory)
+        self._timer = context.window_manager.event_timer_add(self.TIMER_INTERVAL, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.cancel(context)
+            self.report({'WARNING'}, "Export cancelled.")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'RUNNING_MODAL'}
+
+        end = time.perf_counter() + self.TIME_SLICE
         try:
-            export_manager.export(context, self.directory)
+            status = next(self._steps)
+            while time.perf_counter() < end:
+                status = next(self._steps)
+        except StopIteration as ex:
+            self.finish(context)
+            self.report_result(ex.value)
+            return {'FINISHED'}
         except ExportError as ex:
+            self.finish(context)
             self.report({'ERROR'}, ex.args[0])
+            return {'FINISHED'}
+        except Exception:
+            self.cancel(context)
+            raise
+
+        context.workspace.status_text_set(f"Exporting: {status}  (Esc to cancel)")
+        return {'RUNNING_MODAL'}
+
+    def cancel(self, context):
+        if self._steps is not None:
+            self._steps.close()
+        self.finish(context)
+
+    def finish(self, context):
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        context.workspace.status_text_set(None)
+
+    def report_result(self, result: export_manager.ExportResult):
+        for report_type, message in result.messages:
+            self.report({report_type}, message)
+
+        if result.prof is not None:
+            report = result.prof.format_table()
+            print(report)
+            self.report({'INFO'}, report)
+
+
+class SCENE_OT_mkwctt_texture_cache_purge(bpy.types.Operator):
+    bl_idname = 'scene.mkwctt_texture_cache_purge'
+    bl_label = "Purge Texture Cache"
+    bl_description = "Delete all the texture data cached by previous exports"
+
+    def execute(self, context):
+        freed = texture_cache.TextureCache().purge()
+        self.report({'INFO'}, f"Freed {freed / (1024 * 1024):.1f} MB of cached texture data.")
         return {'FINISHED'}
 
 
@@ -51,3 +217,27 @@ class SCENE_PT_mkwctt_export_settings(bpy.types.Panel):
 
         layout.label(text="Settings", icon='PREFERENCES')
         layout.prop(export_settings, 'scale')
+
+        layout.prop(export_settings, 'use_quantization')
+        if export_settings.use_quantization:
+            layout.prop(export_settings, 'quantization_tolerance')
+
+        layout.prop(export_settings, 'use_texture_cache')
+        if export_settings.use_texture_cache:
+            layout.prop(export_settings, 'texture_cache_size')
+        layout.operator('scene.mkwctt_texture_cache_purge', icon='TRASH')
+
+        layout.prop(export_settings, 'use_object_cache')
+        if export_settings.use_object_cache:
+            layout.prop(export_settings, 'persist_object_cache')
+
+        layout.prop(export_settings, 'use_multiprocessing')
+        if export_settings.use_multiprocessing:
+            layout.prop(export_settings, 'worker_count')
+        layout.prop(export_settings, 'use_parallel_write')
+        layout.prop(export_settings, 'use_streaming_write')
+        layout.prop(export_settings, 'keep_intermediate_file')
+
+        layout.prop(export_settings, 'enable_profiling')
+        if export_settings.enable_profiling:
+            layout.prop(export_settings, 'profile_filepath')
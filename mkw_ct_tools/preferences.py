@@ -0,0 +1,29 @@
+import bpy
+
+
+class ADDON_AP_mkwctt_preferences(bpy.types.AddonPreferences):
+    bl_idname = __package__
+
+    builder_path: bpy.props.StringProperty(
+        name="SZS Builder",
+        description="The SZSBuilder executable, built from the szs_builder directory of the add-on, for Windows or Linux",
+        subtype='FILE_PATH',
+    )
+
+    use_builder_service: bpy.props.BoolProperty(
+        name="Keep Builder Running",
+        description="Keep a builder process running between exports and send it the track data through a pipe, which skips the startup of the builder on repeated exports",
+        default=False,
+    )
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        layout.prop(self, 'builder_path')
+        layout.prop(self, 'use_builder_service')
+
+
+def get_preferences(context) -> ADDON_AP_mkwctt_preferences:
+    return context.preferences.addons[__package__].preferences
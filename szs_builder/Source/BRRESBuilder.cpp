@@ -1,5 +1,6 @@
 #include "BRRESBuilder.hpp"
 
+#include <vector>
 
 #include <CTLib/Ext/MDL0.hpp>
 #include <CTLib/Utilities.hpp>
@@ -171,47 +172,120 @@ void createDefaultMaterial(CTLib::MDL0* mdl0)
     mat->setShader(mdl0->get<CTLib::MDL0::Shader>(DEFAULT_RESOURCE_NAME));
 }
 
-void buildPart(CTLib::Buffer& data, CTLib::MDL0* mdl0, const std::string& objName, uint32_t colourCount, uint32_t texcoordCount, const CTLib::Buffer& stringTable)
+// Size in bytes of the indices into each array of an object.
+struct IndexSizes
+{
+    uint8_t vertex;
+    uint8_t normal;
+    std::vector<uint8_t> colours;
+    std::vector<uint8_t> texcoords;
+};
+
+// Reads the index sizes from the headers of the arrays of the object in `data`.
+IndexSizes readIndexSizes(const CTLib::Buffer& data, uint32_t vertDataOff, uint32_t normDataOff, uint32_t colourDataOff, uint32_t texcoordDataOff)
+{
+    IndexSizes sizes;
+    sizes.vertex = data.get(vertDataOff + 0x06);
+    sizes.normal = data.get(normDataOff + 0x06);
+
+    uint32_t colourLayerCount = data.getInt(colourDataOff);
+    uint32_t colourOff = colourDataOff + 0x04;
+    for (uint32_t i = 0; i < colourLayerCount; ++i)
+    {
+        auto format = static_cast<CTLib::MDL0::ColourArray::Format>(data.get(colourOff + 0x04));
+        sizes.colours.push_back(data.get(colourOff + 0x06));
+        colourOff += 0x08 + data.getInt(colourOff) * CTLib::MDL0::ColourArray::byteCount(format);
+    }
+
+    uint32_t texcoordLayerCount = data.getInt(texcoordDataOff);
+    uint32_t texcoordOff = texcoordDataOff + 0x04;
+    for (uint32_t i = 0; i < texcoordLayerCount; ++i)
+    {
+        auto format = static_cast<CTLib::MDL0::TexCoordArray::Format>(data.get(texcoordOff + 0x04));
+        sizes.texcoords.push_back(data.get(texcoordOff + 0x06));
+        texcoordOff += 0x08 + data.getInt(texcoordOff) * 0x02 * CTLib::MDL0::TexCoordArray::byteCount(format);
+    }
+
+    return sizes;
+}
+
+// Builds the part in `data` for the bone `objName`, using the arrays of the
+// object `arraysName`. For instances, the two differ and the part is renamed
+// after the instance.
+void buildPart(CTLib::Buffer& data, CTLib::MDL0* mdl0, const std::string& objName, const std::string& arraysName, const IndexSizes& indexSizes, const CTLib::Buffer& stringTable)
 {
     uint32_t nameOff = data.getInt();
     std::string name = (char*)(*stringTable + nameOff);
+    if (objName != arraysName)
+    {
+        name = objName + name.substr(arraysName.size()); // part names start with the name of their object
+    }
 
     uint32_t matNameOff = data.getInt();
     std::string matName = (char*)(*stringTable + matNameOff);
 
+    uint32_t geoSize = data.getInt();
+
     CTLib::MDL0::Bone* bone = mdl0->get<CTLib::MDL0::Bone>(objName);
 
     CTLib::MDL0::Object* obj = mdl0->add<CTLib::MDL0::Object>(name);
     obj->setBone(bone);
-    obj->setVertexArray(mdl0->get<CTLib::MDL0::VertexArray>(objName));
-    obj->setVertexArrayIndexSize(2);
-    obj->setNormalArray(mdl0->get<CTLib::MDL0::NormalArray>(objName));
-    obj->setNormalArrayIndexSize(2);
+    obj->setVertexArray(mdl0->get<CTLib::MDL0::VertexArray>(arraysName));
+    obj->setVertexArrayIndexSize(indexSizes.vertex);
+    obj->setNormalArray(mdl0->get<CTLib::MDL0::NormalArray>(arraysName));
+    obj->setNormalArrayIndexSize(indexSizes.normal);
 
-    for (uint32_t i = 0; i < colourCount; ++i)
+    for (uint32_t i = 0; i < indexSizes.colours.size(); ++i)
     {
-        obj->setColourArray(mdl0->get<CTLib::MDL0::ColourArray>(CTLib::Strings::format("%s___#%d", objName.c_str(), i)), i);
-        obj->setColourArrayIndexSize(i, 2);
+        obj->setColourArray(mdl0->get<CTLib::MDL0::ColourArray>(CTLib::Strings::format("%s___#%d", arraysName.c_str(), i)), i);
+        obj->setColourArrayIndexSize(i, indexSizes.colours[i]);
     }
 
-    for (uint32_t i = 0; i < texcoordCount; ++i)
+    for (uint32_t i = 0; i < indexSizes.texcoords.size(); ++i)
     {
-        obj->setTexCoordArray(mdl0->get<CTLib::MDL0::TexCoordArray>(CTLib::Strings::format("%s___#%d", objName.c_str(), i)), i);
-        obj->setTexCoordArrayIndexSize(i, 2);
+        obj->setTexCoordArray(mdl0->get<CTLib::MDL0::TexCoordArray>(CTLib::Strings::format("%s___#%d", arraysName.c_str(), i)), i);
+        obj->setTexCoordArrayIndexSize(i, indexSizes.texcoords[i]);
     }
 
-    uint32_t idxSize = 0x04 + colourCount * 0x02 + texcoordCount * 0x02;
-
+    // triangle strip and triangle list commands, parsed by CTLib up to the limit
     CTLib::Buffer geoData = data.slice();
-    uint16_t idxCount = geoData.getShort(0x01);
-    geoData.limit(0x03 + idxCount * idxSize);
+    geoData.limit(geoSize);
     obj->setGeometryData(geoData);
 
     CTLib::MDL0::Material* mat = mdl0->get<CTLib::MDL0::Material>(matName);
     mdl0->getDrawOpaSection()->link(obj, mat, bone);
 }
 
-void buildObject(CTLib::Buffer& data, CTLib::MDL0* mdl0, const CTLib::Buffer& stringTable)
+// Builds the parts of the object in `data` for the bone `name`, reusing the
+// arrays of that object, which must have been built already.
+void buildInstance(CTLib::Buffer& data, CTLib::MDL0* mdl0, const std::string& name, const CTLib::Buffer& stringTable)
+{
+    uint32_t sourceNameOff = data.getInt();
+    std::string sourceName = (char*)(*stringTable + sourceNameOff);
+
+    uint32_t vertDataOff = data.getInt();
+    uint32_t normDataOff = data.getInt();
+    uint32_t colourDataOff = data.getInt();
+    uint32_t texcoordDataOff = data.getInt();
+    uint32_t partDataOff = data.getInt();
+
+    IndexSizes indexSizes = readIndexSizes(data, vertDataOff, normDataOff, colourDataOff, texcoordDataOff);
+
+    data.position(partDataOff);
+    CTLib::Buffer partData = data.slice();
+    uint32_t partCount = data.getInt();
+    for (uint32_t i = 0; i < partCount; ++i)
+    {
+        uint32_t partOff = data.getInt();
+        partData.position(partOff);
+        buildPart(partData.slice(), mdl0, name, sourceName, indexSizes, stringTable);
+    }
+}
+
+// Builds the object in `data`, in the objects section `objsData`. Objects with
+// a vertex data offset of 0 are instances, sharing the arrays and parts of the
+// object at the offset in place of the normal data offset.
+void buildObject(CTLib::Buffer& data, const CTLib::Buffer& objsData, CTLib::MDL0* mdl0, const CTLib::Buffer& stringTable)
 {
     uint32_t nameOff = data.getInt();
     std::string name = (char*)(*stringTable + nameOff);
@@ -227,30 +301,49 @@ void buildObject(CTLib::Buffer& data, CTLib::MDL0* mdl0, const CTLib::Buffer& st
     bone->setRotation({data.getFloat(), data.getFloat(), data.getFloat()});
     bone->setScale({data.getFloat(), data.getFloat(), data.getFloat()});
 
+    if (vertDataOff == 0)
+    {
+        CTLib::Buffer sourceData = objsData.duplicate();
+        sourceData.position(normDataOff);
+        buildInstance(sourceData.slice(), mdl0, name, stringTable);
+        return;
+    }
+
     data.position(vertDataOff);
     CTLib::Buffer vertData = data.slice();
     uint32_t vertCount = vertData.getInt();
-    vertData.limit(vertData.position() + vertCount * 0x0C);
+    auto vertFormat = static_cast<CTLib::MDL0::VertexArray::Format>(vertData.get());
+    uint8_t vertDivisor = vertData.get();
+    vertData.getShort(); // index size and padding
+    vertData.limit(vertData.position() + vertCount * 0x03 * CTLib::MDL0::VertexArray::byteCount(vertFormat));
     CTLib::MDL0::VertexArray* va = mdl0->add<CTLib::MDL0::VertexArray>(name);
-    va->setData(vertData);
+    va->setDivisor(vertDivisor); // before the data, which the bounding box is computed from
+    va->setData(vertData, CTLib::MDL0::VertexArray::Components::XYZ, vertFormat);
 
     data.position(normDataOff);
     CTLib::Buffer normData = data.slice();
     uint32_t normCount = normData.getInt();
-    normData.limit(normData.position() + normCount * 0x0C);
+    auto normFormat = static_cast<CTLib::MDL0::NormalArray::Format>(normData.get());
+    uint8_t normDivisor = normData.get();
+    normData.getShort(); // index size and padding
+    normData.limit(normData.position() + normCount * 0x03 * CTLib::MDL0::NormalArray::byteCount(normFormat));
     CTLib::MDL0::NormalArray* na = mdl0->add<CTLib::MDL0::NormalArray>(name);
-    na->setData(normData);
+    na->setDivisor(normDivisor);
+    na->setData(normData, CTLib::MDL0::NormalArray::Components::Normal, normFormat);
 
     data.position(colourDataOff);
     CTLib::Buffer colourData = data.slice();
     uint32_t colourLayerCount = colourData.getInt();
     for (uint32_t i = 0; i < colourLayerCount; ++i)
     {
-        colourData.limit(colourData.position() + 0x04);
+        colourData.limit(colourData.position() + 0x08);
         uint32_t colourCount = colourData.getInt();
-        colourData.limit(colourData.position() + colourCount * 0x04);
+        auto colourFormat = static_cast<CTLib::MDL0::ColourArray::Format>(colourData.get());
+        colourData.get(); // divisor, unused by colours
+        colourData.getShort(); // index size and padding
+        colourData.limit(colourData.position() + colourCount * CTLib::MDL0::ColourArray::byteCount(colourFormat));
         CTLib::MDL0::ColourArray* ca = mdl0->add<CTLib::MDL0::ColourArray>(CTLib::Strings::format("%s___#%d", name.c_str(), i));
-        ca->setData(colourData);
+        ca->setData(colourData, colourFormat);
     }
 
     data.position(texcoordDataOff);
@@ -258,13 +351,19 @@ void buildObject(CTLib::Buffer& data, CTLib::MDL0* mdl0, const CTLib::Buffer& st
     uint32_t texcoordLayerCount = texcoordData.getInt();
     for (uint32_t i = 0; i < texcoordLayerCount; ++i)
     {
-        texcoordData.limit(texcoordData.position() + 0x04);
+        texcoordData.limit(texcoordData.position() + 0x08);
         uint32_t texcoordCount = texcoordData.getInt();
-        texcoordData.limit(texcoordData.position() + texcoordCount * 0x08);
+        auto texcoordFormat = static_cast<CTLib::MDL0::TexCoordArray::Format>(texcoordData.get());
+        uint8_t texcoordDivisor = texcoordData.get();
+        texcoordData.getShort(); // index size and padding
+        texcoordData.limit(texcoordData.position() + texcoordCount * 0x02 * CTLib::MDL0::TexCoordArray::byteCount(texcoordFormat));
         CTLib::MDL0::TexCoordArray* tca = mdl0->add<CTLib::MDL0::TexCoordArray>(CTLib::Strings::format("%s___#%d", name.c_str(), i));
-        tca->setData(texcoordData);
+        tca->setDivisor(texcoordDivisor);
+        tca->setData(texcoordData, CTLib::MDL0::TexCoordArray::Components::ST, texcoordFormat);
     }
 
+    IndexSizes indexSizes = readIndexSizes(data, vertDataOff, normDataOff, colourDataOff, texcoordDataOff);
+
     data.position(partDataOff);
     CTLib::Buffer partData = data.slice();
     uint32_t partCount = data.getInt();
@@ -272,7 +371,7 @@ void buildObject(CTLib::Buffer& data, CTLib::MDL0* mdl0, const CTLib::Buffer& st
     {
         uint32_t partOff = data.getInt();
         partData.position(partOff);
-        buildPart(partData.slice(), mdl0, name, colourLayerCount, texcoordLayerCount, stringTable);
+        buildPart(partData.slice(), mdl0, name, name, indexSizes, stringTable);
     }
 }
 
@@ -330,7 +429,7 @@ CTLib::BRRES buildBRRES(CTLib::Buffer& data, const char* name, const CTLib::Buff
     {
         uint32_t objOff = data.getInt();
         objData.position(objOff);
-        buildObject(objData.slice(), mdl0, stringTable);
+        buildObject(objData.slice(), objData, mdl0, stringTable);
     }
 
     return brres;
@@ -1,12 +1,140 @@
-
+#include <cstdint>
+#include <cstdio>
 #include <filesystem>
 #include <iostream>
+#include <string>
+#include <vector>
+
+#ifdef _WIN32
+#include <fcntl.h>
+#include <io.h>
+#endif
 
 #include <CTLib/Utilities.hpp>
 
 #include "SZSBuilder.hpp"
 
 
+// Builds the archive from `data` and writes it to `output`. On failure, returns
+// false and sets `error` to a description of the error.
+bool buildFile(CTLib::Buffer& data, const std::filesystem::path& output, std::string& error)
+{
+    CTLib::Buffer szsData;
+    try
+    {
+        szsData = buildArchive(data);
+    }
+    catch (const std::runtime_error& ex)
+    {
+        error = ex.what();
+        return false;
+    }
+
+    if (!CTLib::IO::writeFile(output.string(), szsData))
+    {
+        error = "ERROR: Could not write output file";
+        return false;
+    }
+    return true;
+}
+
+bool readExact(uint8_t* data, size_t size)
+{
+    return std::fread(data, 1, size, stdin) == size;
+}
+
+bool readUint32(uint32_t& value)
+{
+    uint8_t data[4];
+    if (!readExact(data, 4))
+    {
+        return false;
+    }
+    value = (uint32_t(data[0]) << 24) | (uint32_t(data[1]) << 16) | (uint32_t(data[2]) << 8) | uint32_t(data[3]);
+    return true;
+}
+
+void writeUint32(uint32_t value)
+{
+    uint8_t data[4] = {
+        static_cast<uint8_t>(value >> 24), static_cast<uint8_t>(value >> 16),
+        static_cast<uint8_t>(value >> 8), static_cast<uint8_t>(value)
+    };
+    std::fwrite(data, 1, 4, stdout);
+}
+
+void writeResponse(uint32_t status, const std::string& message)
+{
+    writeUint32(status);
+    writeUint32(static_cast<uint32_t>(message.size()));
+    std::fwrite(message.data(), 1, message.size(), stdout);
+    std::fflush(stdout);
+}
+
+void setBinaryMode()
+{
+#ifdef _WIN32
+    _setmode(_fileno(stdin), _O_BINARY);
+    _setmode(_fileno(stdout), _O_BINARY);
+#endif
+}
+
+// Reads stdin until its end.
+CTLib::Buffer readInput()
+{
+    std::vector<uint8_t> input;
+    uint8_t chunk[0x10000];
+    size_t read;
+    while ((read = std::fread(chunk, 1, sizeof(chunk), stdin)) > 0)
+    {
+        input.insert(input.end(), chunk, chunk + read);
+    }
+
+    CTLib::Buffer data(input.size());
+    data.putArray(input.data(), input.size());
+    data.flip();
+    return data;
+}
+
+// Builds archives sent over stdin until it is closed, so the process startup
+// is paid once for many builds. All integers are big endian.
+//
+// Each request is the length of the output path, the output path (UTF-8), the
+// length of the .szs.data payload and the payload. Each response is a status
+// (0 on success) followed by the length of a message and the message.
+int runServer()
+{
+    setBinaryMode();
+
+    uint32_t pathSize;
+    while (readUint32(pathSize))
+    {
+        std::string path(pathSize, '\0');
+        uint32_t dataSize;
+        if (!readExact(reinterpret_cast<uint8_t*>(path.data()), pathSize) || !readUint32(dataSize))
+        {
+            return -1;
+        }
+
+        CTLib::Buffer data(dataSize);
+        if (!readExact(*data, dataSize))
+        {
+            return -1;
+        }
+
+        std::string error;
+        if (buildFile(data, std::filesystem::u8path(path), error))
+        {
+            writeResponse(0, "");
+        }
+        else
+        {
+            writeResponse(1, error);
+        }
+    }
+    return 0;
+}
+
 int main(int argc, char* argv[])
 {
     if (argc < 2)
@@ -14,6 +142,28 @@ int main(int argc, char* argv[])
         std::cout << "ERROR: No input file" << std::endl;
         return -1;
     }
+    if (std::string(argv[1]) == "--server")
+    {
+        return runServer();
+    }
+    if (std::string(argv[1]) == "-")
+    {
+        if (argc < 3)
+        {
+            std::cout << "ERROR: No output file" << std::endl;
+            return -1;
+        }
+        setBinaryMode();
+        CTLib::Buffer data = readInput();
+
+        std::string error;
+        if (!buildFile(data, std::filesystem::u8path(argv[2]), error))
+        {
+            std::cout << error << std::endl;
+            return -1;
+        }
+        return 0;
+    }
     std::filesystem::path input(argv[1]);
 
     if (!std::filesystem::is_regular_file(input))
@@ -23,26 +173,16 @@ int main(int argc, char* argv[])
     }
     CTLib::Buffer data = CTLib::IO::readFile(input.string());
 
-    CTLib::Buffer szsData;
-    try
-    {
-        szsData = buildArchive(data);
-    }
-    catch (const std::runtime_error& ex)
-    {
-        std::cout << ex.what() << std::endl;
-        return -1;
-    }
-
     std::filesystem::path output = input.replace_extension();
     if (output.extension() != ".szs")
     {
         output.replace_extension(".szs");
     }
 
-    if (!CTLib::IO::writeFile(output.string(), szsData))
+    std::string error;
+    if (!buildFile(data, output, error))
     {
-        std::cout << "ERROR: Could not write output file" << std::endl;
+        std::cout << error << std::endl;
         return -1;
     }
 }
@@ -0,0 +1,156 @@
+"""
+Export many .blend files at once, each in its own background Blender instance
+running `export_track.py`:
+
+    python tools/batch_export.py tracks/*.blend --outdir build/ --builder path/to/SZSBuilder --jobs 8
+
+Each track is exported to its own subdirectory of `--outdir`, named after the
+.blend file (with a number appended for files with the same name), along with
+the log of its Blender instance. Blender is started with `--factory-startup`,
+so the exports do not depend on the user's settings; since the add-on
+preferences are not loaded either, the SZS builder must be given with
+`--builder`. Up to `--jobs` Blender instances run at once; since the export
+itself can use several cores (see the 'Parallel Geometry' and 'Parallel
+Writing' settings), fewer jobs than cores may be faster. Once every track is
+done, a summary of the exit code, time and size of each track is printed and,
+with `--summary`, saved as JSON. The exit code is 0 if every track was
+exported, 1 otherwise.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORT_SCRIPT = os.path.join(TOOLS_DIR, 'export_track.py')
+
+
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description="Export many .blend files with background Blender instances.")
+    parser.add_argument('blends', nargs='*', help=".blend files to export")
+    parser.add_argument('--list', metavar='PATH', help="a text file listing more .blend files, one per line")
+    parser.add_argument('--outdir', required=True, help="the directory to export the tracks to")
+    parser.add_argument('--blender', default=os.environ.get('BLENDER', 'blender'), help="the Blender executable, $BLENDER by default")
+    parser.add_argument('--builder', required=True, help="the SZSBuilder executable")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="number of Blender instances running at once")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds before a track export is killed")
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE', help="override an export setting of every track")
+    parser.add_argument('--summary', metavar='PATH', help="also save the summary as JSON")
+    return parser.parse_args(argv)
+
+def list_blends(args) -> list:
+    blends = list(args.blends)
+    if args.list:
+        with open(args.list) as file:
+            blends += [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    return blends
+
+
+def output_names(blends: list) -> list:
+    """
+    Return the name of the output subdirectory of each of `blends`: the name of
+    the .blend file, followed by a number from the second file with that name
+    on, e.g. 'a/track.blend' and 'b/track.blend' are 'track' and 'track_2'.
+    """
+    names = []
+    used = set()
+    for blend in blends:
+        base = os.path.splitext(os.path.basename(blend))[0]
+        name = base
+        number = 2
+        while name.lower() in used:  # case insensitive file systems
+            name = f"{base}_{number}"
+            number += 1
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def export_track(args, blend: str, name: str) -> dict:
+    outdir = os.path.join(args.outdir, name)
+    os.makedirs(outdir, exist_ok=True)
+    report_path = os.path.join(outdir, 'report.json')
+    if os.path.exists(report_path):
+        os.remove(report_path)
+
+    command = [
+        args.blender, '-b', blend, '--factory-startup', '--python', EXPORT_SCRIPT,
+        '--', '--outdir', outdir, '--builder', os.path.abspath(args.builder), '--report', report_path,
+    ]
+    for setting in args.setting:
+        command += ['--setting', setting]
+
+    start = time.perf_counter()
+    with open(os.path.join(outdir, 'blender.log'), 'w') as log:
+        try:
+            returncode = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout).returncode
+        except subprocess.TimeoutExpired:
+            returncode = None
+    result = {'blend': blend, 'name': name, 'returncode': returncode, 'wall_time': time.perf_counter() - start}
+
+    try:
+        with open(report_path) as file:
+            result['report'] = json.load(file)
+    except (OSError, ValueError):
+        result['report'] = None  # Blender failed before the export script could report
+
+    return result
+
+def succeeded(result: dict) -> bool:
+    return result['returncode'] == 0 and result['report'] is not None and result['report']['status'] == 0
+
+def print_summary(results: list):
+    rows = [("Track", "Status", "Time (s)", "Size (MB)")]
+    for result in results:
+        report = result['report']
+        if succeeded(result):
+            status = "ok"
+        elif result['returncode'] is None:
+            status = "timeout"
+        elif report is not None and 'error' in report:
+            status = f"failed: {report['error']}"
+        else:
+            status = f"failed: exit code {result['returncode']}"
+
+        rows.append((
+            result['name'],
+            status,
+            f"{result['wall_time']:.1f}",
+            f"{report['size'] / (1024 * 1024):.2f}" if succeeded(result) else "-",
+        ))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join([row[0].ljust(widths[0]), row[1].ljust(widths[1])] + [cell.rjust(width) for cell, width in zip(row[2:], widths[2:])]).rstrip())
+
+    failed = sum(not succeeded(result) for result in results)
+    print(f"{len(results) - failed} of {len(results)} tracks exported")
+
+def main():
+    args = parse_args(sys.argv[1:])
+    blends = list_blends(args)
+    if len(blends) == 0:
+        print("No .blend file to export")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:  # each thread waits on a Blender process
+        results = list(pool.map(lambda blend, name: export_track(args, blend, name), blends, output_names(blends)))
+
+    print_summary(results)
+    print(f"Total time: {time.perf_counter() - start:.1f} s")
+
+    if args.summary:
+        with open(args.summary, 'w') as file:
+            json.dump({'jobs': args.jobs, 'wall_time': time.perf_counter() - start, 'tracks': results}, file, indent=2)
+
+    sys.exit(0 if all(succeeded(result) for result in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Benchmark the exporter on synthetic track scenes.
+
+Inside Blender, the scene is built with real data blocks:
+
+    blender --background --factory-startup --python tools/benchmark.py -- --objects 50 --triangles 20000
+
+With a plain Python interpreter, the scene is made of the lightweight stand-ins
+of `bpy_stub`, which exercises the export code without Blender's own overhead:
+
+    python tools/benchmark.py --objects 50 --triangles 20000
+
+For each stage (collecting the output info, writing the output buffer) the
+wall time, triangles per second, bytes per second, peak traced memory and peak
+RSS are reported. The RSS is the peak of the whole process so far, so it never
+decreases from one stage to the next.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+
+MAX_SHADER_STAGES = 8
+
+
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description="Benchmark the MKW CT Tools exporter on synthetic scenes.")
+    parser.add_argument('--objects', type=int, default=10, help="number of mesh objects")
+    parser.add_argument('--triangles', type=int, default=10000, help="number of triangles per object")
+    parser.add_argument('--instances', type=int, default=1, help="number of objects sharing the mesh of each object, as linked duplicates")
+    parser.add_argument('--uv-layers', type=int, default=1, help="number of UV layers per object")
+    parser.add_argument('--color-layers', type=int, default=1, help="number of vertex color layers per object")
+    parser.add_argument('--materials', type=int, default=2, help="number of materials per object")
+    parser.add_argument('--textures', type=int, default=4, help="number of textures")
+    parser.add_argument('--texture-size', type=int, default=256, help="width and height of the textures")
+    parser.add_argument('--shaders', type=int, default=2, help=f"number of shaders, with 1 to {MAX_SHADER_STAGES} stages")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed runs, the best one is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="build the model geometry in this many worker processes, 0 for one per core")
+    parser.add_argument('--parallel-write', action='store_true', help="write the output sections in a thread pool")
+    parser.add_argument('--output', choices=('buffer', 'map', 'stream'), default='buffer', help="write the output to a buffer, or to a temporary file either memory mapped or streamed")
+    parser.add_argument('--stub', action='store_true', help="use the bpy stub even when running inside Blender")
+    parser.add_argument('--json', metavar='PATH', help="also save the results as JSON")
+    return parser.parse_args(argv)
+
+def script_args() -> list:
+    """Return the arguments meant for this script, which follow '--' when run by Blender."""
+    if '--' in sys.argv:
+        return sys.argv[sys.argv.index('--') + 1:]
+    return sys.argv[1:] if 'bpy' not in sys.modules else []
+
+
+def make_grid(tri_count: int, rng: np.random.Generator):
+    """
+    Return the positions and triangles of a randomly displaced grid with
+    `tri_count` triangles.
+    """
+    quads = max(math.ceil(math.sqrt(tri_count / 2)), 1)
+
+    xs, ys = np.meshgrid(np.arange(quads + 1, dtype=np.float32), np.arange(quads + 1, dtype=np.float32), indexing='ij')
+    positions = np.stack([xs.reshape(-1), ys.reshape(-1), rng.random((quads + 1) ** 2, dtype=np.float32)], axis=1)
+
+    corners = (np.arange(quads)[:, None] * (quads + 1) + np.arange(quads)[None, :]).reshape(-1)
+    tris = np.concatenate([
+        np.stack([corners, corners + quads + 1, corners + quads + 2], axis=1),
+        np.stack([corners, corners + quads + 2, corners + 1], axis=1),
+    ], axis=1).reshape(-1, 3)[:tri_count]
+
+    return positions, tris.astype(np.int32)
+
+def make_loop_layers(args, tri_count: int, rng: np.random.Generator):
+    loop_count = tri_count * 3
+    colors = [np.round(rng.random((loop_count, 4), dtype=np.float32) * 16) / 16 for _ in range(args.color_layers)]
+    texcoords = [rng.random((loop_count, 2), dtype=np.float32) for _ in range(args.uv_layers)]
+    return colors, texcoords
+
+def stage_count(shader_idx: int) -> int:
+    return shader_idx % MAX_SHADER_STAGES + 1
+
+
+def build_stub_scene(args, rng: np.random.Generator):
+    import bpy_stub
+
+    images = [bpy_stub.make_image(f"Image{i}", args.texture_size, rng) for i in range(args.textures)]
+    textures = [bpy_stub.make_texture(f"Texture{i}", image) for i, image in enumerate(images)]
+    shaders = [bpy_stub.make_shader(f"Shader{i}", stage_count(i)) for i in range(args.shaders)]
+
+    materials = []
+    for i in range(args.materials):
+        layer_textures = [textures[i % len(textures)]] if len(textures) > 0 else []
+        materials.append(bpy_stub.make_material(f"Material{i}", layer_textures, i % max(len(shaders), 1)))
+
+    objects = []
+    for i in range(args.objects):
+        positions, tris = make_grid(args.triangles, rng)
+        tri_mats = rng.integers(0, max(len(materials), 1), len(tris), dtype=np.int32)
+        colors, texcoords = make_loop_layers(args, len(tris), rng)
+
+        mesh = bpy_stub.Mesh(f"Mesh{i}", positions, tris, tri_mats, colors, texcoords)
+        objects.append(bpy_stub.Object(f"Object{i}", mesh, materials))
+        for j in range(1, args.instances):
+            instance = bpy_stub.Object(f"Object{i}.{j}", mesh, materials)
+            instance.location = bpy_stub.Vector((j * 2., 0., 0.))
+            instance.matrix_world[0][3] = j * 2.
+            objects.append(instance)
+
+    context = bpy_stub.make_context(objects, textures, shaders)
+    context.scene.mkwctt_export_settings.use_multiprocessing = args.workers is not None
+    context.scene.mkwctt_export_settings.worker_count = args.workers or 0
+    context.scene.mkwctt_export_settings.use_parallel_write = args.parallel_write
+    return context
+
+def build_blender_scene(args, rng: np.random.Generator):
+    import bpy
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    import mkw_ct_tools
+    try:
+        mkw_ct_tools.register()
+    except ValueError:
+        pass  # already registered as an installed add-on
+
+    scene = bpy.context.scene
+    export_settings = scene.mkwctt_export_settings
+    export_settings.use_texture_cache = False
+    export_settings.use_object_cache = False
+    export_settings.use_multiprocessing = args.workers is not None
+    export_settings.worker_count = args.workers or 0
+    export_settings.use_parallel_write = args.parallel_write
+
+    textures = []
+    for i in range(args.textures):
+        image = bpy.data.images.new(f"Image{i}", args.texture_size, args.texture_size)
+        image.pixels.foreach_set(rng.random(args.texture_size * args.texture_size * 4, dtype=np.float32))
+        texture = bpy.data.textures.new(f"Texture{i}", 'IMAGE')
+        texture.image = image
+        textures.append(texture)
+
+    for i in range(args.shaders):
+        shader = scene.mkwctt_model_settings.shaders.add()
+        shader.name = f"Shader{i}"
+        for _ in range(stage_count(i)):
+            shader.stages.add()
+
+    materials = []
+    for i in range(args.materials):
+        material = bpy.data.materials.new(f"Material{i}")
+        model_settings = material.mkwctt_model_settings
+        model_settings.enable = True
+        model_settings.shader_index = i % max(args.shaders, 1)
+        if len(textures) > 0:
+            model_settings.layers.add().texture = textures[i % len(textures)]
+        materials.append(material)
+
+    for i in range(args.objects):
+        positions, tris = make_grid(args.triangles, rng)
+
+        mesh = bpy.data.meshes.new(f"Mesh{i}")
+        mesh.from_pydata(positions.tolist(), [], tris.tolist())
+        for material in materials:
+            mesh.materials.append(material)
+        mesh.polygons.foreach_set('material_index', rng.integers(0, max(len(materials), 1), len(tris), dtype=np.int32))
+
+        colors, texcoords = make_loop_layers(args, len(tris), rng)
+        for layer_idx, data in enumerate(colors):
+            mesh.vertex_colors.new(name=f"Col{layer_idx}").data.foreach_set('color', data.reshape(-1))
+        for layer_idx, data in enumerate(texcoords):
+            mesh.uv_layers.new(name=f"UVMap{layer_idx}").data.foreach_set('uv', data.reshape(-1))
+        mesh.update()
+
+        obj = bpy.data.objects.new(f"Object{i}", mesh)
+        scene.collection.objects.link(obj)
+        for j in range(1, args.instances):
+            instance = bpy.data.objects.new(f"Object{i}.{j}", mesh)
+            instance.location = (j * 2., 0., 0.)
+            scene.collection.objects.link(instance)
+
+    return bpy.context
+
+
+def run_once(args, context, export_manager, profiler) -> dict:
+    with profiler.session() as prof:
+        with profiler.phase("collect"):
+            output_info = export_manager.get_output_info(context)
+        rss_collect = profiler.peak_process_memory()
+
+        with profiler.phase("write"):
+            if args.output != 'buffer':
+                context.scene.mkwctt_export_settings.use_streaming_write = args.output == 'stream'
+                with tempfile.TemporaryFile() as file:
+                    export_manager.write_output(context, output_info, file)
+            else:
+                export_manager.write_output(context, output_info)
+        rss_write = profiler.peak_process_memory()
+
+    phases = {stats.name: stats for stats in prof.phases}
+    return {
+        'collect': (phases["collect"], rss_collect),
+        'write': (phases["write"], rss_write),
+        'size': output_info.total_size,
+        'triangles': sum(
+            part_info.tri_count
+            for model_info in output_info.models_output_info.models
+            for obj_info in model_info.objs
+            for part_info in (obj_info.source or obj_info).parts.values()
+        ),
+    }
+
+def main():
+    args = parse_args(script_args())
+    rng = np.random.default_rng(args.seed)
+
+    sys.path.insert(0, REPO_DIR)
+    use_stub = args.stub or 'bpy' not in sys.modules
+    if use_stub:
+        sys.path.insert(0, TOOLS_DIR)
+        import bpy_stub
+        bpy_stub.install()
+
+    start = time.perf_counter()
+    context = build_stub_scene(args, rng) if use_stub else build_blender_scene(args, rng)
+    print(f"Built synthetic scene in {time.perf_counter() - start:.2f} s ({'stub' if use_stub else 'blender'})")
+
+    from mkw_ct_tools.export import export_manager, profiler
+
+    best = None
+    for _ in range(max(args.repeat, 1)):
+        result = run_once(args, context, export_manager, profiler)
+        if best is None or result['collect'][0].wall_time + result['write'][0].wall_time < best['collect'][0].wall_time + best['write'][0].wall_time:
+            best = result
+
+    rows = [("Stage", "Time (s)", "Tris/s", "MB/s", "Peak traced (MB)", "Peak RSS (MB)")]
+    stages = []
+    for stage in ('collect', 'write'):
+        stats, rss = best[stage]
+        wall_time = max(stats.wall_time, 1e-9)
+        stages.append({
+            'stage': stage,
+            'wall_time': stats.wall_time,
+            'triangles_per_second': best['triangles'] / wall_time,
+            'bytes_per_second': best['size'] / wall_time,
+            'peak_traced_memory': stats.peak_memory,
+            'peak_rss': rss,
+        })
+        rows.append((
+            stage,
+            f"{stats.wall_time:.3f}",
+            f"{best['triangles'] / wall_time:,.0f}",
+            f"{best['size'] / wall_time / (1024 * 1024):.1f}",
+            f"{stats.peak_memory / (1024 * 1024):.1f}",
+            "-" if rss is None else f"{rss / (1024 * 1024):.1f}",
+        ))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    print(f"{args.objects} objects x {args.instances} instances x {args.triangles} triangles, {best['size']:,} bytes of output")
+    for row in rows:
+        print("  ".join([row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'mode': 'stub' if use_stub else 'blender', 'stages': stages}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Minimal stand-ins for the `bpy` and `mathutils` modules, and for the Blender
+data the exporter reads, so the export code can be benchmarked with a plain
+Python interpreter. Only what the exporter uses is implemented; this is not a
+general purpose emulation of the Blender API.
+"""
+
+import sys
+import tempfile
+import types
+
+import numpy as np
+
+
+class Vector(tuple):
+
+    def __new__(cls, seq=(0., 0., 0.)):
+        return super().__new__(cls, (float(x) for x in seq))
+
+    def __mul__(self, other):
+        return Vector(x * other for x in self)
+
+    __rmul__ = __mul__
+
+
+class _Types(types.ModuleType):
+    """Create an empty class for any `bpy.types` name on first access."""
+
+    def __getattr__(self, name):
+        cls = type(name, (), {})
+        setattr(self, name, cls)
+        return cls
+
+
+def _prop(name):
+    def prop(**kwargs):
+        return (name, kwargs)
+    return prop
+
+
+def install():
+    """Register the stub `bpy` and `mathutils` modules in `sys.modules`."""
+    bpy = types.ModuleType('bpy')
+    bpy.types = _Types('bpy.types')
+
+    bpy.props = types.ModuleType('bpy.props')
+    for name in ('BoolProperty', 'CollectionProperty', 'EnumProperty', 'FloatProperty', 'FloatVectorProperty',
+                 'IntProperty', 'PointerProperty', 'StringProperty'):
+        setattr(bpy.props, name, _prop(name))
+
+    resource_dir = tempfile.mkdtemp(prefix='mkwctt_bench_')
+    bpy.utils = types.SimpleNamespace(
+        register_class=lambda cls: None,
+        unregister_class=lambda cls: None,
+        user_resource=lambda resource_type, path='', create=False: resource_dir,
+    )
+    bpy.path = types.SimpleNamespace(abspath=lambda path, library=None: path)
+    bpy.app = types.SimpleNamespace(version=(0, 0, 0), handlers=types.SimpleNamespace())
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Vector = Vector
+
+    sys.modules['bpy'] = bpy
+    sys.modules['bpy.types'] = bpy.types
+    sys.modules['bpy.props'] = bpy.props
+    sys.modules['mathutils'] = mathutils
+
+
+class _EnumProperty:
+    default = ''
+    enum_items = {'': types.SimpleNamespace(value=0)}
+
+
+class _RNA:
+
+    class _Properties:
+
+        def __getitem__(self, key):
+            return _EnumProperty
+
+    properties = _Properties()
+
+
+class Struct(types.SimpleNamespace):
+    """
+    Property group with fixed values. Enum properties are given as their
+    number, which is what `utils.get_enum_number` returns.
+    """
+
+    bl_rna = _RNA()
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class ArrayCollection:
+    """Collection of `count` items whose attributes are read with `foreach_get`."""
+
+    def __init__(self, count: int, **attrs):
+        self._count = count
+        self._attrs = attrs
+
+    def __len__(self):
+        return self._count
+
+    def foreach_get(self, attr, seq):
+        seq[:] = np.asarray(self._attrs[attr]).reshape(-1)
+
+
+class Pixels:
+
+    def __init__(self, data: np.ndarray):
+        self._data = data
+
+    def __len__(self):
+        return len(self._data)
+
+    def foreach_get(self, seq):
+        seq[:] = self._data
+
+
+class Mesh:
+
+    def __init__(self, name: str, positions: np.ndarray, tris: np.ndarray, tri_mats: np.ndarray, colors: list, texcoords: list):
+        self.name = name
+        self.name_full = name
+
+        tri_count = len(tris)
+        loops = np.arange(tri_count * 3, dtype=np.int32).reshape(tri_count, 3)
+        normals = np.repeat(np.array([[0., 0., 1.]], dtype=np.float32), len(positions), axis=0)
+
+        self.vertices = ArrayCollection(len(positions), co=positions, normal=normals)
+        self.loops = ArrayCollection(tri_count * 3, vertex_index=tris)
+        self.polygons = ArrayCollection(tri_count, loop_start=loops[:, 0], loop_total=np.full(tri_count, 3), material_index=tri_mats)
+        self.loop_triangles = ArrayCollection(tri_count, vertices=tris, loops=loops, material_index=tri_mats)
+
+        self.vertex_colors = [Struct(name=f"Col{i}", data=ArrayCollection(tri_count * 3, color=data)) for i, data in enumerate(colors)]
+        self.uv_layers = [Struct(name=f"UVMap{i}", data=ArrayCollection(tri_count * 3, uv=data)) for i, data in enumerate(texcoords)]
+        self.shape_keys = None
+
+    def calc_loop_triangles(self):
+        pass
+
+
+class Object:
+
+    def __init__(self, name: str, mesh: Mesh, materials: list):
+        self.name = name
+        self.name_full = name
+        self.type = 'MESH'
+        self.data = mesh
+        self.modifiers = []
+        self.material_slots = [Struct(name=mat.name, material=mat, slot_index=i, link='DATA') for i, mat in enumerate(materials)]
+
+        self.location = Vector((0., 0., 0.))
+        self.rotation_euler = Vector((0., 0., 0.))
+        self.scale = Vector((1., 1., 1.))
+        self.matrix_world = [[1., 0., 0., 0.], [0., 1., 0., 0.], [0., 0., 1., 0.], [0., 0., 0., 1.]]
+
+        self.mkwctt_model_settings = Struct(enable=True)
+        self.mkwctt_collision_settings = Struct(
+            enable=True, kcl_type=0, kcl_variant=0, kcl_trickable=False, kcl_non_drivable=False, kcl_soft_wall=False,
+        )
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+
+def make_image(name: str, size: int, rng: np.random.Generator):
+    return Struct(
+        name=name, size=(size, size), channels=4, alpha_mode='STRAIGHT', colorspace_settings=Struct(name='sRGB'),
+        filepath='', library=None, packed_file=None, is_dirty=False, source='GENERATED',
+        pixels=Pixels(rng.random(size * size * 4, dtype=np.float32)),
+    )
+
+def make_texture(name: str, image):
+    return Struct(
+        name=name, type='IMAGE', image=image,
+        mkwctt_model_settings=Struct(format=0, gen_mipmaps=False, gen_mipmap_count=0),
+    )
+
+def make_shader(name: str, stage_count: int):
+    return Struct(name=name, stages=[Struct(use_texture=True, uv_map_index=0, co_clamp=True, ao_clamp=True) for _ in range(stage_count)])
+
+def make_material(name: str, textures: list, shader_index: int):
+    return Struct(
+        name=name,
+        mkwctt_model_settings=Struct(
+            enable=True, color=(1., 1., 1.), shader_index=shader_index,
+            layers=[Struct(texture=tex, wrap_mode=0, min_filter=0, mag_filter=0) for tex in textures],
+        ),
+        mkwctt_collision_settings=Struct(enable=False),
+    )
+
+def make_context(objects: list, textures: list, shaders: list, scale: float = 1000.):
+    collection = Struct(
+        name="Scene Collection", name_full="Scene Collection", objects=objects, children=[],
+        mkwctt_collection_settings=Struct(has_model=True, is_skybox=False, has_collision=True),
+    )
+    scene = Struct(
+        collection=collection, objects=objects,
+        mkwctt_model_settings=Struct(shaders=shaders),
+        mkwctt_race_settings=Struct(
+            track_slot=0, lap_count=3, start_side=0,
+            start_point=Struct(location=Vector((0., 0., 0.)), rotation_euler=Vector((0., 0., 0.))),
+        ),
+        mkwctt_export_settings=Struct(
+            scale=scale, use_texture_cache=False, texture_cache_size=0, use_object_cache=False, persist_object_cache=False,
+            use_quantization=False, quantization_tolerance=0.001, use_multiprocessing=False, worker_count=0, use_parallel_write=False, use_streaming_write=False, keep_intermediate_file=False, enable_profiling=False, profile_filepath='',
+        ),
+    )
+    return Struct(
+        scene=scene, blend_data=Struct(textures=textures, filepath=''),
+        view_layer=Struct(layer_collection=Struct(collection=collection, exclude=False, children=[])),
+        evaluated_depsgraph_get=lambda: None,
+    )
@@ -0,0 +1,120 @@
+"""
+Export the track of a .blend file without the UI, for scripted and batch
+builds:
+
+    blender -b track.blend --factory-startup --python tools/export_track.py -- --outdir build/ --builder path/to/SZSBuilder
+
+The add-on is enabled from this repository, which is put first on the module
+path, so it takes precedence over an installed copy unless that copy was
+already enabled at startup (i.e. without `--factory-startup`). With
+`--factory-startup`, the add-on preferences are not loaded either, so the SZS
+builder must be given with `--builder`.
+
+The export settings saved in the .blend file are used, and can be overridden
+with `--setting NAME=VALUE`, e.g. `--setting use_streaming_write=True`. With
+`--report`, the timing and size of the export are saved as JSON, along with the
+stats of each phase of the export. The exit code is 0 on success, 1 if the
+export failed.
+"""
+
+import argparse
+import ast
+from dataclasses import asdict
+import json
+import os
+import sys
+import time
+import traceback
+
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+
+
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description="Export the track of the open .blend file to an SZS archive.")
+    parser.add_argument('--outdir', required=True, help="the directory to export the archive to")
+    parser.add_argument('--builder', help="the SZSBuilder executable, overriding the add-on preferences")
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE', help="override an export setting of the scene")
+    parser.add_argument('--report', metavar='PATH', help="save the timing and size of the export as JSON")
+    return parser.parse_args(argv)
+
+def script_args() -> list:
+    """Return the arguments meant for this script, which follow '--'."""
+    if '--' in sys.argv:
+        return sys.argv[sys.argv.index('--') + 1:]
+    return []
+
+def enable_addon():
+    import addon_utils
+
+    sys.path.insert(0, REPO_DIR)
+    if addon_utils.enable('mkw_ct_tools', default_set=True) is None:
+        raise RuntimeError("Could not enable the MKW CT Tools add-on.")
+
+def apply_settings(export_settings, settings: list):
+    for setting in settings:
+        name, _, value = setting.partition('=')
+        if not hasattr(export_settings, name):
+            raise ValueError(f"Unknown export setting '{name}'.")
+        try:
+            value = ast.literal_eval(value)
+        except (SyntaxError, ValueError):
+            pass  # plain strings, such as paths
+        setattr(export_settings, name, value)
+
+
+def export(args) -> dict:
+    import bpy
+
+    enable_addon()
+    from mkw_ct_tools import preferences
+    from mkw_ct_tools.export import builder, export_manager
+
+    context = bpy.context
+    if args.builder:
+        preferences.get_preferences(context).builder_path = os.path.abspath(args.builder)
+
+    export_settings = context.scene.mkwctt_export_settings
+    apply_settings(export_settings, args.setting)
+    export_settings.enable_profiling = True
+
+    outdir = os.path.join(os.path.abspath(args.outdir), '')
+    os.makedirs(outdir, exist_ok=True)
+    szs_filepath = builder.szs_filepath(export_manager.output_filepath(context, outdir))
+
+    start = time.perf_counter()
+    result = export_manager.export(context, outdir)
+    for _, message in result.messages:
+        print(message)
+
+    return {
+        'blend': bpy.data.filepath,
+        'output': szs_filepath,
+        'wall_time': time.perf_counter() - start,
+        'size': os.path.getsize(szs_filepath),
+        'phases': [asdict(stats) for stats in result.prof.phases],
+    }
+
+def main():
+    args = parse_args(script_args())
+
+    try:
+        report = export(args)
+        report['status'] = 0
+    except Exception as ex:
+        traceback.print_exc()
+        report = {'status': 1, 'error': str(ex)}
+
+    if report['status'] == 0:
+        print(f"Exported '{report['output']}' ({report['size']:,} bytes) in {report['wall_time']:.2f} s")
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    sys.exit(report['status'])
+
+
+if __name__ == '__main__':
+    main()